@@ -13,5 +13,8 @@ pip install -r requirements.txt
 # Install the en_core_web_md model for spaCy
 python -m spacy download en_core_web_md
 
+# Install the smaller en_core_web_sm model for the lightweight profile
+python -m spacy download en_core_web_sm
+
 # Deactivate the environment
 deactivate
@@ -6,21 +6,42 @@
 
 # Importing libraries
 import argparse
+import functools
+import hashlib
+import json
 import os
-import spacy
+import sqlite3
+import time
 import pandas as pd
 import re
-from codecarbon import EmissionsTracker
+
+# Pipeline components each feature group depends on ('pos_' is mapped from the tagger's tags by the attribute ruler)
+FEATURE_COMPONENTS = {
+    'pos': ['tok2vec', 'tagger', 'attribute_ruler'],
+    'entities': ['ner'],
+}
+PIPELINE_COMPONENTS = ['tok2vec', 'tagger', 'parser', 'senter', 'attribute_ruler', 'lemmatizer', 'ner']
 
 # Defining argument parsing
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Extract linguistic features from text files.')
     parser.add_argument('--dataset_path', type=str, required=True, help='Path to the dataset directory containing sub-folders with text files')
     parser.add_argument('--output_dir', type=str, default='../out', help='Output directory for the resulting CSV files and emission files')
-    return parser.parse_args()
-
-# Loading spacy
-nlp = spacy.load("en_core_web_md")
+    parser.add_argument('--parallel', action='store_true', help='Stream the texts of each sub-folder through nlp.pipe instead of parsing them one at a time')
+    parser.add_argument('--batch_size', type=int, default=32, help='Number of texts buffered per nlp.pipe batch in parallel mode')
+    parser.add_argument('--n_process', type=int, default=1, help='Number of processes used by nlp.pipe in parallel mode (-1 uses all CPU cores)')
+    parser.add_argument('--model', type=str, default='en_core_web_md', help='Name of the SpaCy model to use, e.g. en_core_web_sm for a smaller model')
+    parser.add_argument('--features', type=str, nargs='+', choices=list(FEATURE_COMPONENTS), default=list(FEATURE_COMPONENTS), help='Feature groups to extract')
+    parser.add_argument('--minimal_pipeline', action='store_true', help='Only load the pipeline components needed for the requested features')
+    parser.add_argument('--compare_models', type=str, nargs='+', default=None, help='Benchmark the given models against --model on a sample of files and save a comparison report instead of extracting features')
+    parser.add_argument('--compare_sample', type=int, default=50, help='Number of files used for the model comparison report')
+    parser.add_argument('--stream', action='store_true', help='Read, clean, and parse every file in bounded chunks so that very large documents fit in memory')
+    parser.add_argument('--chunk_size', type=int, default=20000, help='Number of characters read per chunk in streaming mode')
+    parser.add_argument('--cache_path', type=str, default=None, help='Path to an SQLite file used to cache the extracted features of unchanged files between runs')
+    args = parser.parse_args()
+    if args.stream and (args.parallel or args.n_process != 1):
+        parser.error("--stream parses one file at a time and cannot be combined with --parallel or --n_process")
+    return args
 
 ##### 
 # Defining Functions
@@ -38,46 +59,382 @@ def cleaning_text(text):
     """
     return re.sub(r'<.*?>', '', text)
 
-def process_text(file_path, nlp):
+@functools.lru_cache(maxsize=1)
+def load_nlp(model_name, features, minimal_pipeline):
     """
-    Processes a text file to extract linguistic features.
+    Loads a SpaCy model, optionally excluding the components that the requested features do not need.
+    SpaCy is only imported on the first call and the loaded model is cached for the rest of the process.
+
+    Parameters:
+        model_name (str): Name of the SpaCy model.
+        features (tuple of str): Feature groups that will be extracted.
+        minimal_pipeline (bool): Whether to exclude unneeded pipeline components.
+
+    Returns:
+        spacy.Language: The loaded SpaCy language model.
+    """
+    import spacy
+
+    if not minimal_pipeline:
+        return spacy.load(model_name)
+    required = {component for feature in features for component in FEATURE_COMPONENTS[feature]}
+    exclude = [component for component in PIPELINE_COMPONENTS if component not in required]
+    return spacy.load(model_name, exclude=exclude)
+
+def read_text(file_path):
+    """
+    Reads a text file and cleans its content.
 
     Parameters:
         file_path (str): Path to the text file.
-        nlp (spacy.Language): The SpaCy language model.
 
     Returns:
-        dict: Extracted linguistic features.
+        str: The cleaned text.
     """
     with open(file_path, 'r', encoding='latin1') as f:
-        text = cleaning_text(f.read())
-
-    doc = nlp(text)
-
-    pos_counts = {'NOUN': 0, 'VERB': 0, 'ADJ': 0, 'ADV': 0}
-    unique_entities = {'PERSON': set(), 'LOC': set(), 'ORG': set()}
-
-    for token in doc:
-        if token.pos_ in pos_counts:
-            pos_counts[token.pos_] += 1
-    for ent in doc.ents:
-        if ent.label_ in unique_entities:
-            unique_entities[ent.label_].add(ent.text)
-
-    total_words = len([token for token in doc if token.is_alpha])
-    relative_freq = {pos: ((count / total_words) * 10000) for pos, count in pos_counts.items()}
-
-    data = {
-        'RelFreq NOUN': relative_freq.get('NOUN', 0),
-        'RelFreq VERB': relative_freq.get('VERB', 0),
-        'RelFreq ADJ': relative_freq.get('ADJ', 0),
-        'RelFreq ADV': relative_freq.get('ADV', 0),
-        'Unique PER': len(unique_entities['PERSON']),
-        'Unique LOC': len(unique_entities['LOC']),
-        'Unique ORG': len(unique_entities['ORG']),
+        return cleaning_text(f.read())
+
+def new_feature_counts():
+    """
+    Creates empty running counts for the linguistic features.
+
+    Returns:
+        dict: POS counts, number of alphabetic tokens, and sets of unique entities.
+    """
+    return {
+        'pos': {'NOUN': 0, 'VERB': 0, 'ADJ': 0, 'ADV': 0},
+        'total_words': 0,
+        'entities': {'PERSON': set(), 'LOC': set(), 'ORG': set()},
     }
+
+def count_features(doc, features, counts):
+    """
+    Adds the POS counts, alphabetic tokens, and unique entities of a processed SpaCy document to running counts.
+
+    Parameters:
+        doc (spacy.tokens.Doc): The processed document.
+        features (list of str): Feature groups to extract ('pos' and/or 'entities').
+        counts (dict): Running counts created by new_feature_counts, updated in place.
+    """
+    if 'pos' in features:
+        pos_counts = counts['pos']
+        for token in doc:
+            if token.pos_ in pos_counts:
+                pos_counts[token.pos_] += 1
+        counts['total_words'] += len([token for token in doc if token.is_alpha])
+
+    if 'entities' in features:
+        unique_entities = counts['entities']
+        for ent in doc.ents:
+            if ent.label_ in unique_entities:
+                unique_entities[ent.label_].add(ent.text)
+
+def summarise_features(counts, features):
+    """
+    Turns running counts into relative frequencies and numbers of unique entities.
+
+    Parameters:
+        counts (dict): Running counts created by new_feature_counts.
+        features (list of str): Feature groups to extract ('pos' and/or 'entities').
+
+    Returns:
+        dict: Extracted linguistic features.
+    """
+    data = {}
+
+    if 'pos' in features:
+        total_words = counts['total_words']
+        relative_freq = {pos: ((count / total_words) * 10000) for pos, count in counts['pos'].items()}
+
+        data['RelFreq NOUN'] = relative_freq.get('NOUN', 0)
+        data['RelFreq VERB'] = relative_freq.get('VERB', 0)
+        data['RelFreq ADJ'] = relative_freq.get('ADJ', 0)
+        data['RelFreq ADV'] = relative_freq.get('ADV', 0)
+
+    if 'entities' in features:
+        unique_entities = counts['entities']
+        data['Unique PER'] = len(unique_entities['PERSON'])
+        data['Unique LOC'] = len(unique_entities['LOC'])
+        data['Unique ORG'] = len(unique_entities['ORG'])
+
     return data
 
+def extract_features(doc, features):
+    """
+    Extracts linguistic features from a processed SpaCy document.
+
+    Parameters:
+        doc (spacy.tokens.Doc): The processed document.
+        features (list of str): Feature groups to extract ('pos' and/or 'entities').
+
+    Returns:
+        dict: Extracted linguistic features.
+    """
+    counts = new_feature_counts()
+    count_features(doc, features, counts)
+    return summarise_features(counts, features)
+
+def find_chunk_boundary(text):
+    """
+    Finds the last paragraph, line, sentence, or word boundary in a piece of text.
+    Line boundaries are always accepted, as the '<...>' tags removed by cleaning_text never span lines. Sentence and
+    word boundaries inside an unclosed tag are skipped, so cleaning the text on either side gives the same result as
+    cleaning it as a whole.
+
+    Parameters:
+        text (str): The text to split.
+
+    Returns:
+        int: Position right after the boundary, or 0 if the text has no boundary.
+    """
+    for separator in ('\n\n', '\n'):
+        cut = text.rfind(separator) + len(separator)
+        if cut >= len(separator):
+            return cut
+    for separator in ('. ', ' '):
+        cut = text.rfind(separator) + len(separator)
+        if cut >= len(separator) and text.rfind('<', 0, cut) <= text.rfind('>', 0, cut):
+            return cut
+    return 0
+
+def iter_text_chunks(file_path, chunk_size):
+    """
+    Reads and cleans a text file in bounded chunks that end on paragraph, line, sentence, or word boundaries.
+
+    Parameters:
+        file_path (str): Path to the text file.
+        chunk_size (int): Number of characters read at a time.
+
+    Yields:
+        str: The cleaned chunks of text.
+    """
+    buffer = ''
+    with open(file_path, 'r', encoding='latin1') as f:
+        for block in iter(lambda: f.read(chunk_size), ''):
+            buffer += block
+            cut = find_chunk_boundary(buffer)
+            if cut:
+                yield cleaning_text(buffer[:cut])
+                buffer = buffer[cut:]
+    if buffer:
+        yield cleaning_text(buffer)
+
+def process_text(file_path, nlp, features):
+    """
+    Processes a text file to extract linguistic features.
+
+    Parameters:
+        file_path (str): Path to the text file.
+        nlp (spacy.Language): The SpaCy language model.
+        features (list of str): Feature groups to extract.
+
+    Returns:
+        dict: Extracted linguistic features.
+    """
+    return extract_features(nlp(read_text(file_path)), features)
+
+def process_texts_parallel(file_paths, nlp, features, batch_size, n_process):
+    """
+    Processes several text files by streaming their cleaned texts through nlp.pipe.
+    The returned features are in the same order as the given file paths.
+
+    Parameters:
+        file_paths (list of str): Paths to the text files.
+        nlp (spacy.Language): The SpaCy language model.
+        features (list of str): Feature groups to extract.
+        batch_size (int): Number of texts buffered per batch.
+        n_process (int): Number of processes to use (-1 uses all CPU cores).
+
+    Returns:
+        list of dict: Extracted linguistic features for each file.
+    """
+    texts = (read_text(file_path) for file_path in file_paths)
+    return [extract_features(doc, features) for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
+
+def process_text_streaming(file_path, nlp, features, chunk_size, batch_size):
+    """
+    Processes a text file chunk by chunk and aggregates the linguistic features across chunks,
+    so memory use does not grow with the size of the file. Files that fit in one chunk give exactly the same
+    features as process_text. Longer files may give slightly different POS tags and entities than parsing the
+    whole file at once, because the model does not see the context across chunk boundaries.
+
+    Parameters:
+        file_path (str): Path to the text file.
+        nlp (spacy.Language): The SpaCy language model.
+        features (list of str): Feature groups to extract.
+        chunk_size (int): Number of characters read at a time.
+        batch_size (int): Number of chunks buffered per nlp.pipe batch.
+
+    Returns:
+        dict: Extracted linguistic features.
+    """
+    counts = new_feature_counts()
+    for doc in nlp.pipe(iter_text_chunks(file_path, chunk_size), batch_size=batch_size):
+        count_features(doc, features, counts)
+    return summarise_features(counts, features)
+
+def compare_models(dataset_path, output_dir, model_names, features, sample_size):
+    """
+    Compares the speed and accuracy of full and minimal pipelines for several SpaCy models on a sample of files.
+    The full pipeline of the first model is used as the reference the others are compared against.
+
+    Parameters:
+        dataset_path (str): Path to the dataset directory containing sub-folders with text files.
+        output_dir (str): Directory to save the comparison report.
+        model_names (list of str): Names of the SpaCy models to compare.
+        features (list of str): Feature groups to extract.
+        sample_size (int): Number of files to sample from the dataset.
+
+    Returns:
+        pd.DataFrame: The comparison report.
+    """
+    file_paths = []
+    for directory in sorted(os.listdir(dataset_path)):
+        subfolder = os.path.join(dataset_path, directory)
+        file_paths.extend(os.path.join(subfolder, text_file) for text_file in sorted(os.listdir(subfolder)))
+    file_paths = file_paths[::max(1, len(file_paths) // sample_size)][:sample_size]
+    texts = [read_text(file_path) for file_path in file_paths]
+
+    reference = None
+    report = []
+    for model_name in model_names:
+        for minimal_pipeline in (False, True):
+            nlp = load_nlp(model_name, tuple(features), minimal_pipeline)
+            start_time = time.perf_counter()
+            results = pd.DataFrame([extract_features(doc, features) for doc in nlp.pipe(texts)])
+            elapsed = time.perf_counter() - start_time
+            if reference is None:
+                reference = results
+
+            row = {
+                'Model': model_name,
+                'Pipeline': 'minimal' if minimal_pipeline else 'full',
+                'Components': ' '.join(nlp.pipe_names),
+                'Docs/sec': len(texts) / elapsed,
+                'ms/doc': elapsed / len(texts) * 1000,
+            }
+            for column in results.columns:
+                if column.startswith('RelFreq'):
+                    row[f'{column} MAE'] = (results[column] - reference[column]).abs().mean()
+                else:
+                    row[f'{column} Match'] = (results[column] == reference[column]).mean()
+            report.append(row)
+            print(f"{model_name} ({row['Pipeline']}): {row['Docs/sec']:.2f} docs/sec")
+
+    df = pd.DataFrame(report)
+    report_path = os.path.join(output_dir, 'model_comparison.csv')
+    df.to_csv(report_path, index=False)
+    print(f"Model comparison saved to {report_path}")
+    return df
+
+def open_cache(cache_path):
+    """
+    Opens (and creates if needed) the SQLite feature cache.
+
+    Parameters:
+        cache_path (str): Path to the SQLite cache file.
+
+    Returns:
+        sqlite3.Connection: Connection to the cache.
+    """
+    cache_dir = os.path.dirname(cache_path)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    conn = sqlite3.connect(cache_path)
+    # Earlier versions kept the file path in the feature table, so identical files shared one path
+    if 'file_path' in [row[1] for row in conn.execute("PRAGMA table_info(features)")]:
+        conn.execute("DROP TABLE features")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS features (
+            content_hash TEXT NOT NULL,
+            model TEXT NOT NULL,
+            model_version TEXT NOT NULL,
+            feature_set TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (content_hash, model, model_version, feature_set)
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS files (
+            file_path TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL
+        )""")
+    return conn
+
+def cache_key(nlp, features, chunk_size=None):
+    """
+    Builds the part of the cache key that describes the model and the extracted features.
+
+    Parameters:
+        nlp (spacy.Language): The SpaCy language model.
+        features (list of str): Feature groups to extract.
+        chunk_size (int, optional): Chunk size when files are processed in streaming mode.
+
+    Returns:
+        tuple: Model name, model version, and feature set.
+    """
+    feature_set = ','.join(sorted(features))
+    if chunk_size:
+        feature_set += f';chunk_size={chunk_size}'
+    return f"{nlp.meta['lang']}_{nlp.meta['name']}", nlp.meta['version'], feature_set
+
+def lookup_cached_features(conn, content_hash, key):
+    """
+    Looks up the cached features of a file.
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to the cache.
+        content_hash (str): Hash of the file content.
+        key (tuple): Model name, model version, and feature set.
+
+    Returns:
+        dict or None: The cached features, or None if the file has not been processed before.
+    """
+    row = conn.execute(
+        "SELECT data FROM features WHERE content_hash = ? AND model = ? AND model_version = ? AND feature_set = ?",
+        (content_hash, *key)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def store_cached_features(conn, content_hash, key, data):
+    """
+    Stores the features of a file content.
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to the cache.
+        content_hash (str): Hash of the file content.
+        key (tuple): Model name, model version, and feature set.
+        data (dict): Extracted linguistic features.
+    """
+    conn.execute("INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?)", (content_hash, *key, json.dumps(data)))
+
+def record_files(conn, file_paths, content_hashes):
+    """
+    Records the current content of each file and evicts the features of contents that no file has anymore,
+    e.g. those of earlier versions of an edited file. Files with the same content share their features.
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to the cache.
+        file_paths (list of str): Absolute paths to the text files.
+        content_hashes (list of str): Hash of the content of each file.
+    """
+    conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?)", zip(file_paths, content_hashes))
+    conn.execute("DELETE FROM features WHERE content_hash NOT IN (SELECT content_hash FROM files)")
+
+def evict_stale_entries(conn, key):
+    """
+    Removes cache entries for files that no longer exist and for other versions of the current model.
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to the cache.
+        key (tuple): Model name, model version, and feature set.
+    """
+    model, model_version, _ = key
+    conn.execute("DELETE FROM features WHERE model = ? AND model_version != ?", (model, model_version))
+    file_paths = [row[0] for row in conn.execute("SELECT file_path FROM files")]
+    conn.executemany("DELETE FROM files WHERE file_path = ?",
+                     [(file_path,) for file_path in file_paths if not os.path.exists(file_path)])
+    conn.execute("DELETE FROM features WHERE content_hash NOT IN (SELECT content_hash FROM files)")
+    conn.commit()
+
 #####
 # Main Function
 #####
@@ -88,8 +445,24 @@ def main():
     dataset_path = args.dataset_path
     output_path = args.output_dir
 
+    if not os.path.isdir(dataset_path):
+        raise SystemExit(f"Dataset directory not found: {dataset_path}")
+
     os.makedirs(output_path, exist_ok=True)
 
+    if args.compare_models:
+        compare_models(dataset_path, output_path, [args.model] + args.compare_models, args.features, args.compare_sample)
+        return
+
+    from codecarbon import EmissionsTracker
+
+    nlp = load_nlp(args.model, tuple(args.features), args.minimal_pipeline)
+
+    conn = open_cache(args.cache_path) if args.cache_path else None
+    if conn:
+        key = cache_key(nlp, args.features, args.chunk_size if args.stream else None)
+        evict_stale_entries(conn, key)
+
     for directory in sorted(os.listdir(dataset_path)):
         subfolder = os.path.join(dataset_path, directory)
         filenames = sorted(os.listdir(subfolder))
@@ -102,15 +475,47 @@ def main():
             output_file="emissions.csv")
         tracker.start()
 
-        for text_file in filenames:
-            file_path = os.path.join(subfolder, text_file)
-            file_data = process_text(file_path, nlp)
+        file_paths = [os.path.join(subfolder, text_file) for text_file in filenames]
+        file_features = [None] * len(file_paths)
+        if conn:
+            content_hashes = []
+            for file_path in file_paths:
+                with open(file_path, 'rb') as f:
+                    content_hashes.append(hashlib.file_digest(f, 'sha256').hexdigest())
+            file_features = [lookup_cached_features(conn, content_hash, key) for content_hash in content_hashes]
+        missing = [i for i, file_data in enumerate(file_features) if file_data is None]
+        missing_paths = [file_paths[i] for i in missing]
+
+        start_time = time.perf_counter()
+        if args.stream:
+            new_features = [process_text_streaming(file_path, nlp, args.features, args.chunk_size, args.batch_size) for file_path in missing_paths]
+        elif args.parallel:
+            new_features = process_texts_parallel(missing_paths, nlp, args.features, args.batch_size, args.n_process)
+        else:
+            new_features = [process_text(file_path, nlp, args.features) for file_path in missing_paths]
+        elapsed = time.perf_counter() - start_time
+
+        for i, file_data in zip(missing, new_features):
+            file_features[i] = file_data
+            if conn:
+                store_cached_features(conn, content_hashes[i], key, file_data)
+        if conn:
+            record_files(conn, [os.path.abspath(file_path) for file_path in file_paths], content_hashes)
+            conn.commit()
+
+        for text_file, file_data in zip(filenames, file_features):
             results.append({'Filename': text_file, **file_data})
         df = pd.DataFrame(results)
         df.to_csv(os.path.join(output_path, f"{directory}_linguistic_features.csv"), index=False)
         print(f"Linguistic feature extraction completed. Results are saved in {output_path}")
+        print(f"Processed {len(missing_paths)} documents in '{directory}' in {elapsed:.2f}s ({len(missing_paths) / elapsed:.2f} docs/sec)")
+        if conn:
+            print(f"Reused cached features for {len(file_paths) - len(missing_paths)} unchanged documents in '{directory}'")
 
         tracker.stop()
 
+    if conn:
+        conn.close()
+
 if __name__ == "__main__":
     main()
@@ -7,8 +7,8 @@ if [ -z "$1" ]; then
 fi
 
 # Validate the script name
-if [ "$1" != "logistic_reg_classifier.py" ] && [ "$1" != "neural_network_classifier.py" ]; then
-    echo "Invalid script name. Use either 'logistic_reg_classifier.py' or 'neural_network_classifier.py'"
+if [ "$1" != "logistic_reg_classifier.py" ] && [ "$1" != "neural_network_classifier.py" ] && [ "$1" != "benchmark.py" ] && [ "$1" != "sweep.py" ] && [ "$1" != "streaming_classifier.py" ] && [ "$1" != "predict.py" ]; then
+    echo "Invalid script name. Use 'logistic_reg_classifier.py', 'neural_network_classifier.py', 'benchmark.py', 'sweep.py', 'streaming_classifier.py', or 'predict.py'"
     exit 1
 fi
 
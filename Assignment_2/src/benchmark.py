@@ -0,0 +1,402 @@
+#####
+# Assignment 2 - Text Classification Benchmarks
+# Shared training and evaluation engine and the registry of benchmarked classifiers
+#####
+
+# Importing packages
+import os
+import argparse
+import time
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from feature_store import get_features
+
+# Defining argument parsing
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train and evaluate several text classifiers on one vectorized dataset.')
+    add_common_args(parser)
+    parser.add_argument('--models', type=str, nargs='+', choices=list(ESTIMATORS), default=list(ESTIMATORS), help='Registered classifiers to benchmark')
+    parser.add_argument('--C', type=float, default=1.0, help='Inverse of the regularisation strength of the logistic regression')
+    parser.add_argument('--activation', type=str, default='logistic', help='Activation function for the neural network')
+    parser.add_argument('--hidden_layer_sizes', type=parse_layer_sizes, default=(20,), help='Comma-separated hidden layer sizes for the neural network, e.g. 20 or 50,20')
+    parser.add_argument('--max_iter', type=int, default=1000, help='Max number of iterations for the neural network')
+    parser.add_argument('--batch_size', type=int, default=None, help='Mini-batch size for the neural network, defaults to min(200, n_samples)')
+    parser.add_argument('--n_jobs', type=int, default=1, help='Number of worker processes training the classifiers in parallel')
+    return parser.parse_args()
+
+def add_common_args(parser):
+    """
+    Adds the dataset, output, and feature store arguments shared by all training scripts.
+
+    Parameters:
+        parser (argparse.ArgumentParser): The parser to add the arguments to.
+    """
+    parser.add_argument('--dataset_path', type=str, required=True, help='Path to the CSV dataset file')
+    parser.add_argument('--output_dir', type=str, default='../out', help='Output directory for the reports and emission files')
+    parser.add_argument('--model_dir', type=str, default='../models', help='Directory to save the trained models and vectorizers')
+    parser.add_argument('--max_features', type=int, default=500, help='Max number of features for the vectorizer')
+    parser.add_argument('--test_size', type=float, default=0.2, help='Part of the dataset to include in the test split')
+    parser.add_argument('--feature_store', type=str, default='../features', help='Directory where vectorized splits are stored and reused between runs')
+    parser.add_argument('--no_feature_store', action='store_true', help='Always load and vectorize the dataset from scratch')
+
+def parse_layer_sizes(value):
+    """
+    Parses a comma-separated list of hidden layer sizes.
+
+    Parameters:
+        value (str): Layer sizes such as '20' or '50,20'.
+
+    Returns:
+        tuple: The hidden layer sizes as integers.
+    """
+    try:
+        return tuple(int(size) for size in value.split(',') if size.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid hidden layer sizes: '{value}'")
+
+#####
+# Defining Functions
+#####
+
+def build_logreg(C=1.0):
+    """
+    Creates an untrained logistic regression classifier.
+
+    Parameters:
+        C (float): Inverse of the regularisation strength.
+
+    Returns:
+        LogisticRegression: The untrained classifier.
+    """
+    from sklearn.linear_model import LogisticRegression
+
+    return LogisticRegression(C=C, random_state=42)
+
+def build_neural(activation='logistic', hidden_layer_sizes=(20,), max_iter=1000, batch_size=None):
+    """
+    Creates an untrained neural network classifier.
+
+    Parameters:
+        activation (str): Activation function for the neural network.
+        hidden_layer_sizes (tuple): Hidden layer sizes for the neural network.
+        max_iter (int): Max number of iterations for the neural network.
+        batch_size (int, optional): Mini-batch size, defaults to min(200, n_samples).
+
+    Returns:
+        MLPClassifier: The untrained classifier.
+    """
+    from sklearn.neural_network import MLPClassifier
+
+    return MLPClassifier(
+        activation=activation,
+        hidden_layer_sizes=hidden_layer_sizes,
+        max_iter=max_iter,
+        batch_size=batch_size or 'auto',
+        random_state=42
+    )
+
+# Registered classifiers: how to build them, which hyperparameters they take, and where their outputs go
+ESTIMATORS = {}
+
+def register_estimator(name, build, params, classifier_file, vectorizer_file, report_file):
+    """
+    Registers a classifier with the benchmark engine.
+
+    Parameters:
+        name (str): Short name of the classifier, used on the command line and in the results table.
+        build (callable): Function returning an untrained classifier with fit and predict methods.
+        params (list of str): Names of the hyperparameters passed to build.
+        classifier_file (str): File name of the saved classifier.
+        vectorizer_file (str): File name of the saved vectorizer.
+        report_file (str): File name of the classification report.
+    """
+    ESTIMATORS[name] = {
+        'build': build,
+        'params': params,
+        'classifier_file': classifier_file,
+        'vectorizer_file': vectorizer_file,
+        'report_file': report_file,
+    }
+
+register_estimator('logreg', build_logreg, ['C'],
+                   'logistic_regression_classifier.joblib', 'vectorizer_logreg.joblib', 'logistic_regression_report.txt')
+register_estimator('neural', build_neural, ['activation', 'hidden_layer_sizes', 'max_iter', 'batch_size'],
+                   'neural_network_classifier.joblib', 'vectorizer_neural.joblib', 'neural_network_report.txt')
+
+# Vectorized datasets shared with the worker processes, keyed by max_features
+_datasets = {}
+
+def start_tracker(experiment_id, output_dir, output_file):
+    """
+    Creates and starts the emissions tracker of a run.
+
+    Parameters:
+        experiment_id (str): Name of the experiment.
+        output_dir (str): Directory to save the emission file.
+        output_file (str): Name of the emission file.
+
+    Returns:
+        EmissionsTracker: The running tracker.
+    """
+    from codecarbon import EmissionsTracker
+
+    os.makedirs(output_dir, exist_ok=True)
+    tracker = EmissionsTracker(
+        project_name="text_classification_benchmarks",
+        experiment_id=experiment_id,
+        output_dir=output_dir,
+        output_file=output_file
+    )
+    tracker.start()
+    return tracker
+
+def load_features(args, tracker=None, max_features=None):
+    """
+    Loads the vectorized split through the feature store, as configured by the common arguments.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+        tracker (EmissionsTracker, optional): Tracker to record the loading and vectorizing tasks with.
+        max_features (int, optional): Max number of features, defaults to args.max_features.
+
+    Returns:
+        tuple: Vectorized training and testing data, labels, and the vectorizer.
+    """
+    feature_store = None if args.no_feature_store else args.feature_store
+    return get_features(args.dataset_path, "text", "label", max_features or args.max_features, args.test_size, feature_store, tracker)
+
+def train_classifier(model, X_train_features, y_train, **params):
+    """
+    Builds and trains a registered classifier.
+
+    Parameters:
+        model (str): Name of the registered classifier.
+        X_train_features (sparse matrix): Vectorized training data.
+        y_train (array): Training labels.
+        **params: Hyperparameters passed to the classifier.
+
+    Returns:
+        object: The trained classifier.
+    """
+    classifier = ESTIMATORS[model]['build'](**params)
+    classifier.fit(X_train_features, y_train)
+    return classifier
+
+def evaluate(y_test, y_pred):
+    """
+    Summarises the predictions on the test data.
+
+    Parameters:
+        y_test (array): True labels for the test data.
+        y_pred (array): Predicted labels for the test data.
+
+    Returns:
+        dict: Accuracy, macro-averaged precision, recall, and F1-score, and the F1-score of every class.
+    """
+    from sklearn import metrics
+
+    report = metrics.classification_report(y_test, y_pred, output_dict=True, zero_division=0)
+    scores = {
+        'accuracy': report['accuracy'],
+        'precision_macro': report['macro avg']['precision'],
+        'recall_macro': report['macro avg']['recall'],
+        'f1_macro': report['macro avg']['f1-score'],
+    }
+    for label, label_scores in report.items():
+        if isinstance(label_scores, dict) and label not in ('macro avg', 'weighted avg'):
+            scores[f'f1_{label}'] = label_scores['f1-score']
+    return scores
+
+def fit_and_score(config, X_train_features, X_test_features, y_train, y_test):
+    """
+    Trains a configuration and scores it on the test data.
+
+    Parameters:
+        config (dict): Name of the registered classifier ('model'), max_features, and its hyperparameters.
+        X_train_features (sparse matrix): Vectorized training data.
+        X_test_features (sparse matrix): Vectorized testing data.
+        y_train (array): Training labels.
+        y_test (array): Testing labels.
+
+    Returns:
+        tuple: The trained classifier, its test predictions, and a result row with its scores and timings.
+    """
+    params = {param: config[param] for param in ESTIMATORS[config['model']]['params'] if param in config}
+
+    start_time = time.perf_counter()
+    classifier = train_classifier(config['model'], X_train_features, y_train, **params)
+    fit_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    y_pred = classifier.predict(X_test_features)
+    predict_time = time.perf_counter() - start_time
+
+    result = {**config, **evaluate(y_test, y_pred), 'fit_time': fit_time, 'predict_time': predict_time}
+    return classifier, y_pred, result
+
+def init_worker(datasets):
+    """
+    Receives the vectorized datasets once per worker process and limits each worker to a single BLAS thread.
+
+    Parameters:
+        datasets (dict): Vectorized training and testing data and labels, keyed by max_features.
+    """
+    from threadpoolctl import threadpool_limits
+
+    threadpool_limits(limits=1)
+    _datasets.update(datasets)
+
+def run_config(config):
+    """
+    Trains and scores a configuration in a worker process and measures the energy and emissions of that process.
+
+    Parameters:
+        config (dict): The configuration to evaluate.
+
+    Returns:
+        tuple: The trained classifier and the result row, including energy and emissions.
+    """
+    from codecarbon import EmissionsTracker
+
+    tracker = EmissionsTracker(
+        project_name="text_classification_benchmarks",
+        experiment_id="benchmark_worker",
+        tracking_mode="process",
+        save_to_file=False,
+        log_level="error"
+    )
+    tracker.start()
+    classifier, _, result = fit_and_score(config, *_datasets[config['max_features']])
+    result['emissions'] = tracker.stop()
+    result['energy_consumed'] = tracker.final_emissions_data.energy_consumed
+    return classifier, result
+
+def benchmark_estimators(configs, datasets, n_jobs=1, tracker=None):
+    """
+    Trains and scores every configuration on the vectorized datasets, either one after the other in this process
+    (recording one tracker task per configuration) or on a pool of worker processes.
+
+    Parameters:
+        configs (list of dict): Configurations to evaluate, each with 'model', 'max_features', and hyperparameters.
+        datasets (dict): Vectorized training and testing data and labels, keyed by max_features.
+        n_jobs (int): Number of worker processes, 1 to train in this process.
+        tracker (EmissionsTracker, optional): Tracker to record the training tasks with when n_jobs is 1.
+
+    Returns:
+        tuple: The trained classifiers and the result rows, in the order of the configurations.
+    """
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker, initargs=(datasets,)) as executor:
+            outputs = list(executor.map(run_config, configs))
+        return [classifier for classifier, _ in outputs], [result for _, result in outputs]
+
+    classifiers, results = [], []
+    for config in configs:
+        if tracker:
+            tracker.start_task(f"train_and_evaluate_{config['model']}")
+        classifier, _, result = fit_and_score(config, *datasets[config['max_features']])
+        if tracker:
+            task_emissions = tracker.stop_task()
+            result['emissions'] = task_emissions.emissions
+            result['energy_consumed'] = task_emissions.energy_consumed
+        classifiers.append(classifier)
+        results.append(result)
+    return classifiers, results
+
+def results_table(results):
+    """
+    Combines the result rows into one table with the configuration columns first.
+    Integer hyperparameters stay integers even when other classifiers leave them empty.
+
+    Parameters:
+        results (list of dict): The result rows returned by benchmark_estimators.
+
+    Returns:
+        DataFrame: One row per configuration.
+    """
+    df = pd.DataFrame(results)
+    config_columns = ['model', 'max_features'] + [param for estimator in ESTIMATORS.values() for param in estimator['params']]
+    config_columns = [column for column in dict.fromkeys(config_columns) if column in df.columns]
+    df = df[config_columns + [column for column in df.columns if column not in config_columns]]
+    for column in config_columns:
+        values = [result[column] for result in results if result.get(column) is not None]
+        if values and all(isinstance(value, int) for value in values):
+            df[column] = df[column].astype('Int64')
+    return df
+
+def save_models(model, classifier, vectorizer, model_dir):
+    """
+    Saves a trained classifier and its vectorizer under the file names of the registered classifier.
+
+    Parameters:
+        model (str): Name of the registered classifier.
+        classifier (object): The trained classifier.
+        vectorizer (TfidfVectorizer): The vectorizer.
+        model_dir (str): Directory to save the models.
+    """
+    from joblib import dump
+
+    os.makedirs(model_dir, exist_ok=True)
+    classifier_path = os.path.join(model_dir, ESTIMATORS[model]['classifier_file'])
+    vectorizer_path = os.path.join(model_dir, ESTIMATORS[model]['vectorizer_file'])
+    dump(classifier, classifier_path)
+    dump(vectorizer, vectorizer_path)
+    print(f"Model saved at: {classifier_path}")
+    print(f"Vectorizer saved at: {vectorizer_path}")
+
+def save_report(model, y_test, y_pred, output_dir):
+    """
+    Saves the classification report of a registered classifier to a text file.
+
+    Parameters:
+        model (str): Name of the registered classifier.
+        y_test (array): True labels for the test data.
+        y_pred (array): Predicted labels for the test data.
+        output_dir (str): Directory to save the report.
+    """
+    from sklearn import metrics
+
+    os.makedirs(output_dir, exist_ok=True)
+    class_report = metrics.classification_report(y_test, y_pred)
+    report_path = os.path.join(output_dir, ESTIMATORS[model]['report_file'])
+    with open(report_path, 'w') as report_file:
+        report_file.write(class_report)
+    print(f"Report saved at: {report_path}")
+
+#####
+# Main Function
+#####
+
+def main():
+    args = parse_args()
+    tracker = start_tracker("benchmark", args.output_dir, "emissions_benchmark.csv")
+
+    X_train_features, X_test_features, y_train, y_test, vectorizer = load_features(args, tracker)
+    datasets = {args.max_features: (X_train_features, X_test_features, y_train, y_test)}
+
+    configs = [
+        {'model': model, 'max_features': args.max_features, **{param: getattr(args, param) for param in ESTIMATORS[model]['params']}}
+        for model in args.models
+    ]
+    print(f"Benchmarking {', '.join(args.models)} on {args.n_jobs} worker process(es)...")
+    if args.n_jobs > 1:
+        tracker.start_task("benchmark_estimators")
+    classifiers, results = benchmark_estimators(configs, datasets, args.n_jobs, tracker)
+    if args.n_jobs > 1:
+        tracker.stop_task()
+
+    tracker.start_task("save_models")
+    for config, classifier in zip(configs, classifiers):
+        save_models(config['model'], classifier, vectorizer, args.model_dir)
+    tracker.stop_task()
+
+    tracker.stop()
+
+    df = results_table(results)
+    results_path = os.path.join(args.output_dir, 'benchmark_results.csv')
+    df.to_csv(results_path, index=False)
+    print(df[['model', 'accuracy', 'f1_macro', 'fit_time', 'emissions']].to_string(index=False))
+    print(f"Benchmark results saved at: {results_path}")
+
+if __name__ == "__main__":
+    main()
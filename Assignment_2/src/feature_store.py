@@ -0,0 +1,210 @@
+#####
+# Assignment 2 - Text Classification Benchmarks
+# Shared data loading, TF-IDF vectorization, and on-disk feature store
+#####
+
+# Importing packages
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Vectorizer settings shared by all classifiers
+VECTORIZER_PARAMS = {'ngram_range': (1, 2), 'lowercase': True, 'min_df': 0.05}
+RANDOM_STATE = 42
+
+#####
+# Defining Functions
+#####
+
+def load_data(filename):
+    """
+    Loads data from a specified CSV file.
+
+    Parameters:
+        filename (str): Path to the CSV file.
+
+    Returns:
+        DataFrame: Loaded data.
+    """
+    data = pd.read_csv(filename)
+    return data
+
+def split_vectorizer_fit(data, text_column, label_column, max_features, test_size):
+    """
+    Splits the data into training and testing sets and then vectorizes the text data.
+
+    Parameters:
+        data (DataFrame): The dataset containing text and labels.
+        text_column (str): The name of the column containing text data.
+        label_column (str): The name of the column containing labels.
+        max_features (int): Max number of features for the vectorizer.
+        test_size (float): Part of the dataset to include in the test split.
+
+    Returns:
+        tuple: Vectorized training and testing data, labels, and the vectorizer.
+    """
+    from sklearn.model_selection import train_test_split
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    X = data[text_column]
+    y = data[label_column]
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=RANDOM_STATE)
+
+    vectorizer = TfidfVectorizer(
+        **VECTORIZER_PARAMS,
+        max_features=max_features
+    )
+    X_train_features = vectorizer.fit_transform(X_train)
+    X_test_features = vectorizer.transform(X_test)
+
+    return X_train_features, X_test_features, label_array(y_train), label_array(y_test), vectorizer
+
+def label_array(y):
+    """
+    Converts labels to the array type they are stored with in the feature store, so labels are the same whether
+    they come from the store or were just split: text labels become a string array, numeric labels keep their type.
+
+    Parameters:
+        y (Series or array): The labels.
+
+    Returns:
+        array: The labels as a NumPy array without Python objects.
+    """
+    y = np.asarray(y)
+    return y.astype(str) if y.dtype == object else y
+
+def feature_key(dataset_path, text_column, label_column, max_features, test_size):
+    """
+    Builds the key of a feature store entry from the dataset content and the split and vectorizer settings.
+
+    Parameters:
+        dataset_path (str): Path to the CSV dataset file.
+        text_column (str): The name of the column containing text data.
+        label_column (str): The name of the column containing labels.
+        max_features (int): Max number of features for the vectorizer.
+        test_size (float): Part of the dataset to include in the test split.
+
+    Returns:
+        str: The feature store key.
+    """
+    with open(dataset_path, 'rb') as f:
+        dataset_hash = hashlib.file_digest(f, 'sha256').hexdigest()
+    settings = {
+        'dataset': dataset_hash,
+        'text_column': text_column,
+        'label_column': label_column,
+        'max_features': max_features,
+        'test_size': test_size,
+        'random_state': RANDOM_STATE,
+        'vectorizer': VECTORIZER_PARAMS,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+def save_features(store_dir, key, X_train_features, X_test_features, y_train, y_test, vectorizer):
+    """
+    Saves the vectorized split to the feature store under its key. Benchmark and sweep runs may vectorize the
+    same split at the same time, so each writes its own temporary entry and only the first one to be renamed
+    to the key is kept.
+
+    Parameters:
+        store_dir (str): Directory of the feature store.
+        key (str): The feature store key.
+        X_train_features (sparse matrix): Vectorized training data.
+        X_test_features (sparse matrix): Vectorized testing data.
+        y_train (array): Training labels.
+        y_test (array): Testing labels.
+        vectorizer (TfidfVectorizer): The fitted vectorizer (vocabulary and IDF weights).
+    """
+    from joblib import dump
+    from scipy import sparse
+
+    os.makedirs(store_dir, exist_ok=True)
+    entry_dir = os.path.join(store_dir, key)
+    tmp_dir = tempfile.mkdtemp(dir=store_dir)
+    sparse.save_npz(os.path.join(tmp_dir, 'X_train.npz'), X_train_features)
+    sparse.save_npz(os.path.join(tmp_dir, 'X_test.npz'), X_test_features)
+    np.save(os.path.join(tmp_dir, 'y_train.npy'), label_array(y_train))
+    np.save(os.path.join(tmp_dir, 'y_test.npy'), label_array(y_test))
+    dump(vectorizer, os.path.join(tmp_dir, 'vectorizer.joblib'))
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # Another run stored the same entry in the meantime
+        shutil.rmtree(tmp_dir)
+
+def load_features(store_dir, key):
+    """
+    Loads a vectorized split from the feature store.
+
+    Parameters:
+        store_dir (str): Directory of the feature store.
+        key (str): The feature store key.
+
+    Returns:
+        tuple or None: Vectorized training and testing data, labels, and the vectorizer, or None if the entry does not exist.
+    """
+    from joblib import load
+    from scipy import sparse
+
+    entry_dir = os.path.join(store_dir, key)
+    if not os.path.isdir(entry_dir):
+        return None
+    return (
+        sparse.load_npz(os.path.join(entry_dir, 'X_train.npz')),
+        sparse.load_npz(os.path.join(entry_dir, 'X_test.npz')),
+        np.load(os.path.join(entry_dir, 'y_train.npy')),
+        np.load(os.path.join(entry_dir, 'y_test.npy')),
+        load(os.path.join(entry_dir, 'vectorizer.joblib')),
+    )
+
+def get_features(dataset_path, text_column, label_column, max_features, test_size, store_dir=None, tracker=None):
+    """
+    Returns the vectorized split from the feature store, or loads, splits, vectorizes, and stores the data if it is not there yet.
+
+    Parameters:
+        dataset_path (str): Path to the CSV dataset file.
+        text_column (str): The name of the column containing text data.
+        label_column (str): The name of the column containing labels.
+        max_features (int): Max number of features for the vectorizer.
+        test_size (float): Part of the dataset to include in the test split.
+        store_dir (str, optional): Directory of the feature store, or None to always vectorize from scratch.
+        tracker (EmissionsTracker, optional): Tracker to record the loading and vectorizing tasks with.
+
+    Returns:
+        tuple: Vectorized training and testing data, labels, and the vectorizer.
+    """
+    def start_task(name):
+        if tracker:
+            tracker.start_task(name)
+
+    def stop_task():
+        if tracker:
+            tracker.stop_task()
+
+    key = None
+    if store_dir:
+        start_task("load_features")
+        key = feature_key(dataset_path, text_column, label_column, max_features, test_size)
+        features = load_features(store_dir, key)
+        stop_task()
+        if features is not None:
+            print(f"Loaded vectorized features from {os.path.join(store_dir, key)}")
+            return features
+
+    start_task("load_data")
+    data = load_data(dataset_path)
+    stop_task()
+
+    start_task("split_vectorizer_fit")
+    features = split_vectorizer_fit(data, text_column, label_column, max_features, test_size)
+    if store_dir:
+        save_features(store_dir, key, *features)
+        print(f"Saved vectorized features to {os.path.join(store_dir, key)}")
+    stop_task()
+
+    return features
@@ -7,129 +7,104 @@
 # Importing packages
 import os
 import argparse
+import copy
+import time
 import pandas as pd
-from sklearn.neural_network import MLPClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn import metrics
-from joblib import dump
-from codecarbon import EmissionsTracker
+from benchmark import add_common_args, parse_layer_sizes, build_neural, start_tracker, load_features, train_classifier, save_models, save_report
 
 # Defining argument parsing
 def parse_args():
     parser = argparse.ArgumentParser(description='Train a neural network classifier on text data.')
-    parser.add_argument('--dataset_path', type=str, required=True, help='Path to the CSV dataset file')
-    parser.add_argument('--output_dir', type=str, default='../out', help='Output directory for the reports and emission files')
-    parser.add_argument('--model_dir', type=str, default='../models', help='Directory to save the trained models and vectorizers')
-    parser.add_argument('--max_features', type=int, default=500, help='Max number of features for the vectorizer')
-    parser.add_argument('--test_size', type=float, default=0.2, help='Part of the dataset to include in the test split')
+    add_common_args(parser)
     parser.add_argument('--activation', type=str, default='logistic', help='Activation function for the neural network')
-    parser.add_argument('--hidden_layer_sizes', type=tuple, default=(20,), help='Hidden layer sizes for the neural network')
+    parser.add_argument('--hidden_layer_sizes', type=parse_layer_sizes, default=(20,), help='Comma-separated hidden layer sizes for the neural network, e.g. 20 or 50,20')
     parser.add_argument('--max_iter', type=int, default=1000, help='Max number of iterations for the neural network')
+    parser.add_argument('--batch_size', type=int, default=None, help='Mini-batch size for the neural network, defaults to min(200, n_samples)')
+    parser.add_argument('--early_stopping', action='store_true', help='Train epoch by epoch and stop when the validation accuracy no longer improves, logging the loss and time of every epoch with an estimate of its energy use')
+    parser.add_argument('--validation_fraction', type=float, default=0.1, help='Part of the training data held out for early stopping')
+    parser.add_argument('--n_iter_no_change', type=int, default=10, help='Number of epochs without improvement before training stops')
+    parser.add_argument('--tol', type=float, default=1e-4, help='Minimum improvement of the validation accuracy that counts as progress')
     return parser.parse_args()
 
 ##### 
 # Defining Functions
 #####
 
-def load_data(filename):
+def train_classifier_early_stopping(X_train_features, y_train, activation, hidden_layer_sizes, max_iter, batch_size,
+                                    validation_fraction, n_iter_no_change, tol):
     """
-    Loads data from a specified CSV file.
-
-    Parameters:
-        filename (str): Path to the CSV file.
-
-    Returns:
-        DataFrame: Loaded data.
-    """
-    data = pd.read_csv(filename)
-    return data
-
-def split_vectorizer_fit(data, text_column, label_column, max_features, test_size):
-    """
-    Splits the data into training and testing sets and then vectorizes the text data.
-
-    Parameters:
-        data (DataFrame): The dataset containing text and labels.
-        text_column (str): The name of the column containing text data.
-        label_column (str): The name of the column containing labels.
-        max_features (int): Max number of features for the vectorizer.
-        test_size (float): Part of the dataset to include in the test split.
-
-    Returns:
-        tuple: Vectorized training and testing data, labels, and the vectorizer.
-    """
-    X = data[text_column]
-    y = data[label_column]
-
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
-
-    vectorizer = TfidfVectorizer(
-        ngram_range=(1, 2), 
-        lowercase=True,
-        min_df=0.05, 
-        max_features=max_features
-    )
-    X_train_features = vectorizer.fit_transform(X_train)
-    X_test_features = vectorizer.transform(X_test)
-    
-    return X_train_features, X_test_features, y_train, y_test, vectorizer
-
-def train_classifier(X_train_features, y_train, activation, hidden_layer_sizes, max_iter):
-    """
-    Trains a neural network classifier.
+    Trains a neural network classifier one epoch at a time on the sparse training data and stops
+    when the accuracy on a held-out validation split has not improved for n_iter_no_change epochs.
+    The weights of the best epoch are kept.
 
     Parameters:
         X_train_features (sparse matrix): Vectorized training data.
         y_train (array): Training labels.
         activation (str): Activation function for the neural network.
         hidden_layer_sizes (tuple): Hidden layer sizes for the neural network.
-        max_iter (int): Max number of iterations for the neural network.
+        max_iter (int): Max number of epochs.
+        batch_size (int, optional): Mini-batch size, defaults to min(200, n_samples).
+        validation_fraction (float): Part of the training data held out for validation.
+        n_iter_no_change (int): Number of epochs without improvement before training stops.
+        tol (float): Minimum improvement of the validation accuracy that counts as progress.
 
     Returns:
-        MLPClassifier: Trained neural network classifier.
-    """
-    classifier = MLPClassifier(
-        activation=activation, 
-        hidden_layer_sizes=hidden_layer_sizes, 
-        max_iter=max_iter, 
-        random_state=42
-    )
-    classifier.fit(X_train_features, y_train)
-    return classifier
-
-def save_models(classifier, vectorizer, model_dir):
-    """
-    Saves the trained classifier and vectorizer.
-
-    Parameters:
-        classifier (MLPClassifier): The trained classifier.
-        vectorizer (TfidfVectorizer): The vectorizer.
-        model_dir (str): Directory to save the models.
+        tuple: Trained neural network classifier and a list with the loss, validation accuracy, and time of every epoch.
     """
-    os.makedirs(model_dir, exist_ok=True)
-    classifier_path = os.path.join(model_dir, 'neural_network_classifier.joblib')
-    vectorizer_path = os.path.join(model_dir, 'vectorizer_neural.joblib')
-    dump(classifier, classifier_path)
-    dump(vectorizer, vectorizer_path)
-    print(f"Model saved at: {classifier_path}")
-    print(f"Vectorizer saved at: {vectorizer_path}")
-
-def save_report(y_test, y_pred, output_dir):
+    from sklearn.model_selection import train_test_split
+
+    X_fit, X_val, y_fit, y_val = train_test_split(
+        X_train_features, y_train, test_size=validation_fraction, stratify=y_train, random_state=42)
+    classifier = build_neural(activation, hidden_layer_sizes, max_iter, batch_size)
+    classes = sorted(set(y_train))
+
+    training_log = []
+    best_score, best_weights, epochs_no_change = -1, None, 0
+    for epoch in range(1, max_iter + 1):
+        start_time = time.perf_counter()
+        classifier.partial_fit(X_fit, y_fit, classes=classes)
+        epoch_time = time.perf_counter() - start_time
+        val_accuracy = classifier.score(X_val, y_val)
+        training_log.append({
+            'epoch': epoch,
+            'train_loss': classifier.loss_,
+            'val_accuracy': val_accuracy,
+            'epoch_time': epoch_time,
+            'samples_per_sec': X_fit.shape[0] / epoch_time,
+        })
+
+        if val_accuracy > best_score + tol:
+            best_score, best_weights, epochs_no_change = val_accuracy, copy.deepcopy((classifier.coefs_, classifier.intercepts_)), 0
+        else:
+            epochs_no_change += 1
+            if epochs_no_change >= n_iter_no_change:
+                print(f"Validation accuracy did not improve for {n_iter_no_change} epochs, stopping after epoch {epoch}")
+                break
+
+    classifier.coefs_, classifier.intercepts_ = best_weights
+    print(f"Best validation accuracy: {best_score:.4f}")
+    return classifier, training_log
+
+def save_training_log(training_log, task_emissions, output_dir):
     """
-    Saves the classification report to a text file.
+    Saves the per-epoch training log next to the classification report. The energy use and emissions are not
+    measured per epoch: those of the whole training task are divided over the epochs in proportion to their
+    duration, so the columns are named as estimates.
 
     Parameters:
-        y_test (array): True labels for the test data.
-        y_pred (array): Predicted labels for the test data.
-        output_dir (str): Directory to save the report.
+        training_log (list of dict): Loss, validation accuracy, and time of every epoch.
+        task_emissions (EmissionsData): Emissions data of the training task returned by the tracker.
+        output_dir (str): Directory to save the log.
     """
     os.makedirs(output_dir, exist_ok=True)
-    class_report = metrics.classification_report(y_test, y_pred)
-    report_path = os.path.join(output_dir, 'neural_network_report.txt')
-    with open(report_path, 'w') as report_file:
-        report_file.write(class_report)
-    print(f"Report saved at: {report_path}")
+    log = pd.DataFrame(training_log)
+    time_share = log['epoch_time'] / log['epoch_time'].sum()
+    log['cumulative_time'] = log['epoch_time'].cumsum()
+    log['estimated_energy_kwh'] = time_share * task_emissions.energy_consumed
+    log['estimated_emissions'] = time_share * task_emissions.emissions
+    log_path = os.path.join(output_dir, 'neural_network_training_log.csv')
+    log.to_csv(log_path, index=False)
+    print(f"Training log saved at: {log_path}")
 
 #####
 # Main Function
@@ -137,33 +112,30 @@ def save_report(y_test, y_pred, output_dir):
 
 def main():
     args = parse_args()
-    tracker = EmissionsTracker(
-        project_name="text_classification_benchmarks", 
-        experiment_id="neural_network", 
-        output_dir=args.output_dir,
-        output_file=f"emissions_neural.csv"
-    )
-    tracker.start()
-    
-    tracker.start_task("load_data")
-    data = load_data(args.dataset_path)
-    tracker.stop_task()
+    tracker = start_tracker("neural_network", args.output_dir, "emissions_neural.csv")
 
-    tracker.start_task("split_vectorizer_fit")
-    X_train_features, X_test_features, y_train, y_test, vectorizer = split_vectorizer_fit(data, "text", "label", args.max_features, args.test_size)
-    tracker.stop_task()
+    X_train_features, X_test_features, y_train, y_test, vectorizer = load_features(args, tracker)
 
     tracker.start_task("train_classifier")
-    classifier = train_classifier(X_train_features, y_train, args.activation, args.hidden_layer_sizes, args.max_iter)
-    tracker.stop_task()
+    if args.early_stopping:
+        classifier, training_log = train_classifier_early_stopping(
+            X_train_features, y_train, args.activation, args.hidden_layer_sizes, args.max_iter, args.batch_size,
+            args.validation_fraction, args.n_iter_no_change, args.tol)
+    else:
+        classifier = train_classifier('neural', X_train_features, y_train, activation=args.activation,
+                                      hidden_layer_sizes=args.hidden_layer_sizes, max_iter=args.max_iter, batch_size=args.batch_size)
+    task_emissions = tracker.stop_task()
+
+    if args.early_stopping:
+        save_training_log(training_log, task_emissions, args.output_dir)
 
     tracker.start_task("save_models")
-    save_models(classifier, vectorizer, args.model_dir)
+    save_models('neural', classifier, vectorizer, args.model_dir)
     tracker.stop_task()
 
     tracker.start_task("predict_and_save_report_neural")
     y_pred = classifier.predict(X_test_features)
-    save_report(y_test, y_pred, args.output_dir)
+    save_report('neural', y_test, y_pred, args.output_dir)
     tracker.stop_task()
 
     tracker.stop()
@@ -0,0 +1,296 @@
+#####
+# Assignment 2 - Text Classification Benchmarks
+# Batch prediction and a micro-batching inference service for the saved models
+#####
+
+# Importing packages
+import os
+import argparse
+import collections
+import json
+import queue
+import sys
+import threading
+import time
+import numpy as np
+import pandas as pd
+from benchmark import ESTIMATORS
+
+# Defining argument parsing
+def parse_args():
+    parser = argparse.ArgumentParser(description='Score new text with a saved classifier and vectorizer.')
+    parser.add_argument('--model', type=str, choices=list(MODEL_FILES), default='logreg', help="Saved model to load")
+    parser.add_argument('--model_dir', type=str, default='../models', help='Directory containing the saved models and vectorizers')
+    parser.add_argument('--input_path', type=str, default=None, help='CSV file with a text column to score in batches')
+    parser.add_argument('--output_path', type=str, default='../out/predictions.csv', help='CSV file to save the batch predictions to')
+    parser.add_argument('--text_column', type=str, default='text', help='Name of the text column in the input CSV file')
+    parser.add_argument('--serve', type=str, choices=['http', 'stdin'], default=None, help='Run as a local HTTP service or read one text per line from stdin')
+    parser.add_argument('--port', type=int, default=8000, help='Port of the HTTP service')
+    parser.add_argument('--max_batch_size', type=int, default=64, help='Max number of texts scored together')
+    parser.add_argument('--max_wait_ms', type=float, default=5.0, help='Max time a request waits for a batch to fill up')
+    return parser.parse_args()
+
+# Classifier and vectorizer files written by the training scripts
+MODEL_FILES = {name: (estimator['classifier_file'], estimator['vectorizer_file']) for name, estimator in ESTIMATORS.items()}
+
+#####
+# Defining Functions
+#####
+
+def load_models(model, model_dir):
+    """
+    Loads a saved classifier and vectorizer once, memory-mapping their numpy arrays.
+
+    Parameters:
+        model (str): Name of the saved model ('logreg' or 'neural').
+        model_dir (str): Directory containing the saved models and vectorizers.
+
+    Returns:
+        tuple: The classifier and the vectorizer.
+    """
+    from joblib import load
+
+    classifier_file, vectorizer_file = MODEL_FILES[model]
+    classifier = load(os.path.join(model_dir, classifier_file), mmap_mode='r')
+    vectorizer = load(os.path.join(model_dir, vectorizer_file), mmap_mode='r')
+    return classifier, vectorizer
+
+def predict_batch(classifier, vectorizer, texts):
+    """
+    Scores a batch of texts.
+
+    Parameters:
+        classifier (object): The trained classifier.
+        vectorizer (TfidfVectorizer): The fitted vectorizer.
+        texts (list of str): The texts to score.
+
+    Returns:
+        list of dict: Predicted label and class probabilities for each text.
+    """
+    probabilities = classifier.predict_proba(vectorizer.transform(texts))
+    labels = classifier.classes_[probabilities.argmax(axis=1)]
+    return [
+        {'label': str(label), 'probabilities': {str(c): float(p) for c, p in zip(classifier.classes_, row)}}
+        for label, row in zip(labels, probabilities)
+    ]
+
+def predict_file(classifier, vectorizer, input_path, output_path, text_column, batch_size):
+    """
+    Scores every row of a CSV file in batches and saves the predictions.
+
+    Parameters:
+        classifier (object): The trained classifier.
+        vectorizer (TfidfVectorizer): The fitted vectorizer.
+        input_path (str): CSV file with the texts to score.
+        output_path (str): CSV file to save the predictions to.
+        text_column (str): Name of the text column.
+        batch_size (int): Number of rows scored at a time.
+    """
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    start_time = time.perf_counter()
+    n_rows = 0
+    for i, chunk in enumerate(pd.read_csv(input_path, chunksize=batch_size)):
+        predictions = predict_batch(classifier, vectorizer, chunk[text_column].fillna('').tolist())
+        chunk['predicted_label'] = [prediction['label'] for prediction in predictions]
+        for c in classifier.classes_:
+            chunk[f'probability_{c}'] = [prediction['probabilities'][str(c)] for prediction in predictions]
+        chunk.drop(columns=[text_column]).to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        n_rows += len(chunk)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Scored {n_rows} texts in {elapsed:.2f}s ({n_rows / elapsed:.0f} texts/sec)")
+    print(f"Predictions saved at: {output_path}")
+
+class MicroBatcher:
+    """
+    Collects concurrent prediction requests into micro-batches that are scored by a single worker thread,
+    and keeps track of the latency of the most recent requests.
+    """
+
+    def __init__(self, classifier, vectorizer, max_batch_size, max_wait_ms, latency_window=10000):
+        self.classifier = classifier
+        self.vectorizer = vectorizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        # Only the latest requests are kept, so memory and the cost of the percentiles stay bounded in a long-running service
+        self.latencies = collections.deque(maxlen=latency_window)
+        self.n_requests = 0
+        self.n_batches = 0
+        self.start_time = time.perf_counter()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def predict(self, texts):
+        """
+        Queues texts for scoring and waits for their predictions.
+
+        Parameters:
+            texts (list of str): The texts to score.
+
+        Returns:
+            list of dict: Predicted label and class probabilities for each text.
+        """
+        request = {'texts': texts, 'done': threading.Event(), 'received': time.perf_counter()}
+        self.requests.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['predictions']
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            n_texts = len(batch[0]['texts'])
+            deadline = time.perf_counter() + self.max_wait
+            while n_texts < self.max_batch_size:
+                try:
+                    request = self.requests.get(timeout=max(0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                batch.append(request)
+                n_texts += len(request['texts'])
+
+            texts = [text for request in batch for text in request['texts']]
+            try:
+                predictions = predict_batch(self.classifier, self.vectorizer, texts)
+            except Exception as error:
+                for request in batch:
+                    request['error'] = error
+                    request['done'].set()
+                continue
+            self.n_batches += 1
+            offset = 0
+            for request in batch:
+                request['predictions'] = predictions[offset:offset + len(request['texts'])]
+                offset += len(request['texts'])
+                self.latencies.append(time.perf_counter() - request['received'])
+                self.n_requests += 1
+                request['done'].set()
+
+    def stats(self):
+        """
+        Summarises the throughput of the requests served so far and the latency of the most recent ones.
+
+        Returns:
+            dict: Number of requests and batches, p50/p99 latency in milliseconds over the latency window, and requests per second.
+        """
+        latencies = np.array(self.latencies) * 1000
+        elapsed = time.perf_counter() - self.start_time
+        return {
+            'requests': self.n_requests,
+            'batches': self.n_batches,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'requests_per_sec': self.n_requests / elapsed,
+        }
+
+def serve_http(batcher, port):
+    """
+    Serves predictions over HTTP. POST /predict takes {"texts": [...]} (or {"text": "..."}) and GET /stats returns latency statistics.
+
+    Parameters:
+        batcher (MicroBatcher): The micro-batcher to score requests with.
+        port (int): Port to listen on.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._send_json(200, batcher.stats())
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._send_json(404, {'error': 'not found'})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                texts = body['texts'] if 'texts' in body else [body['text']]
+                if not texts or not all(isinstance(text, str) for text in texts):
+                    raise ValueError
+            except (ValueError, KeyError, TypeError):
+                self._send_json(400, {'error': 'expected {"texts": [...]} or {"text": "..."}'})
+                return
+            try:
+                predictions = batcher.predict(texts)
+            except Exception as error:
+                self._send_json(500, {'error': f'prediction failed: {error}'})
+                return
+            self._send_json(200, {'predictions': predictions})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    print(f"Serving predictions on http://127.0.0.1:{port}/predict (statistics on /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+def serve_stdin(batcher):
+    """
+    Reads one text per line from stdin and writes one JSON prediction per line to stdout, in input order.
+    Lines are submitted from a reader thread to a pool of threads so that the micro-batcher can group them.
+    At most a few batches of lines are in flight, so reading a large piped input waits for the predictions
+    to be written instead of buffering the whole input.
+
+    Parameters:
+        batcher (MicroBatcher): The micro-batcher to score requests with.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=batcher.max_batch_size) as executor:
+        pending = queue.Queue(maxsize=4 * batcher.max_batch_size)
+
+        def read_lines():
+            for line in sys.stdin:
+                pending.put(executor.submit(batcher.predict, [line.rstrip('\n')]))
+            pending.put(None)
+
+        threading.Thread(target=read_lines, daemon=True).start()
+        while (future := pending.get()) is not None:
+            try:
+                print(json.dumps(future.result()[0]), flush=True)
+            except Exception as error:
+                print(json.dumps({'error': f'prediction failed: {error}'}), flush=True)
+
+#####
+# Main Function
+#####
+
+def main():
+    args = parse_args()
+    if not args.input_path and not args.serve:
+        raise SystemExit("Specify --input_path to score a CSV file or --serve to start the inference service")
+
+    start_time = time.perf_counter()
+    classifier, vectorizer = load_models(args.model, args.model_dir)
+    print(f"Loaded {args.model} model in {time.perf_counter() - start_time:.2f}s", file=sys.stderr)
+
+    if args.input_path:
+        predict_file(classifier, vectorizer, args.input_path, args.output_path, args.text_column, args.max_batch_size)
+        return
+
+    batcher = MicroBatcher(classifier, vectorizer, args.max_batch_size, args.max_wait_ms)
+    if args.serve == 'http':
+        serve_http(batcher, args.port)
+    else:
+        serve_stdin(batcher)
+    print(f"Latency and throughput: {batcher.stats()}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+#####
+# Assignment 2 - Text Classification Benchmarks
+# Out-of-core training with a hashing vectorizer and incrementally trained linear models
+#####
+
+# Importing packages
+import os
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+# Defining argument parsing
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train a linear text classifier out-of-core on a CSV file that does not fit in memory.')
+    parser.add_argument('--dataset_path', type=str, required=True, help='Path to the CSV dataset file')
+    parser.add_argument('--output_dir', type=str, default='../out', help='Output directory for the reports and emission files')
+    parser.add_argument('--model_dir', type=str, default='../models', help='Directory to save the trained models and vectorizers')
+    parser.add_argument('--model', type=str, choices=CLASSIFIERS, default='sgd', help='Incrementally trainable linear model to use')
+    parser.add_argument('--chunk_size', type=int, default=1000, help='Number of rows read from the CSV file at a time')
+    parser.add_argument('--n_features', type=int, default=2 ** 18, help='Number of hashed features')
+    parser.add_argument('--idf', action='store_true', help='Estimate IDF weights in an extra pass over the training rows')
+    parser.add_argument('--n_epochs', type=int, default=5, help='Number of passes over the training rows')
+    parser.add_argument('--test_size', type=float, default=0.2, help='Part of the dataset to include in the test split')
+    return parser.parse_args()
+
+# Linear models that support partial_fit
+CLASSIFIERS = ['sgd', 'perceptron', 'passive_aggressive']
+
+#####
+# Defining Functions
+#####
+
+def iter_chunks(dataset_path, chunk_size, test_size, text_column="text", label_column="label"):
+    """
+    Reads the CSV file in chunks and assigns every row to the training or testing split.
+    The split is drawn from a fixed seed, so every pass over the file gives the same split.
+
+    Parameters:
+        dataset_path (str): Path to the CSV dataset file.
+        chunk_size (int): Number of rows read at a time.
+        test_size (float): Part of the dataset to include in the test split.
+        text_column (str): The name of the column containing text data.
+        label_column (str): The name of the column containing labels.
+
+    Yields:
+        tuple: Texts, labels, and a boolean mask marking the testing rows of the chunk.
+    """
+    rng = np.random.default_rng(42)
+    for chunk in pd.read_csv(dataset_path, usecols=[text_column, label_column], chunksize=chunk_size):
+        is_test = rng.random(len(chunk)) < test_size
+        yield chunk[text_column].fillna('').to_numpy(), chunk[label_column].astype(str).to_numpy(), is_test
+
+def make_hashing_vectorizer(n_features, norm):
+    """
+    Creates the stateless hashing vectorizer.
+
+    Parameters:
+        n_features (int): Number of hashed features.
+        norm (str or None): Normalisation applied to every row.
+
+    Returns:
+        HashingVectorizer: The hashing vectorizer.
+    """
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    return HashingVectorizer(ngram_range=(1, 2), lowercase=True, n_features=n_features, alternate_sign=False, norm=norm)
+
+def scan_dataset(dataset_path, chunk_size, test_size, n_features, idf):
+    """
+    Makes a first pass over the CSV file to collect the class labels and, optionally, the IDF weights of the training rows.
+
+    Parameters:
+        dataset_path (str): Path to the CSV dataset file.
+        chunk_size (int): Number of rows read at a time.
+        test_size (float): Part of the dataset to include in the test split.
+        n_features (int): Number of hashed features.
+        idf (bool): Whether to estimate IDF weights.
+
+    Returns:
+        tuple: The sorted class labels and the vectorizer to use for training and prediction.
+    """
+    from sklearn.pipeline import make_pipeline
+    from sklearn.feature_extraction.text import TfidfTransformer
+
+    classes = set()
+    hasher = make_hashing_vectorizer(n_features, norm=None)
+    document_freq = np.zeros(n_features, dtype=np.int64)
+    n_documents = 0
+
+    for texts, labels, is_test in iter_chunks(dataset_path, chunk_size, test_size):
+        classes.update(labels)
+        if idf:
+            X = hasher.transform(texts[~is_test])
+            document_freq += np.bincount(X.indices, minlength=n_features)
+            n_documents += X.shape[0]
+
+    if not idf:
+        return np.array(sorted(classes)), make_hashing_vectorizer(n_features, norm='l2')
+
+    # Same smoothed IDF as TfidfVectorizer
+    transformer = TfidfTransformer()
+    transformer.idf_ = np.log((1 + n_documents) / (1 + document_freq)) + 1
+    return np.array(sorted(classes)), make_pipeline(hasher, transformer)
+
+def make_classifier(model):
+    """
+    Creates an untrained linear classifier that supports partial_fit.
+
+    Parameters:
+        model (str): Name of the linear model ('sgd', 'perceptron', or 'passive_aggressive').
+
+    Returns:
+        object: The untrained classifier.
+    """
+    from sklearn.linear_model import SGDClassifier, Perceptron, PassiveAggressiveClassifier
+
+    if model == 'sgd':
+        return SGDClassifier(loss='log_loss', random_state=42)
+    if model == 'perceptron':
+        return Perceptron(random_state=42)
+    return PassiveAggressiveClassifier(random_state=42)
+
+def train_classifier(dataset_path, vectorizer, classes, model, chunk_size, test_size, n_epochs):
+    """
+    Trains a linear classifier incrementally on the training rows, one chunk at a time.
+
+    Parameters:
+        dataset_path (str): Path to the CSV dataset file.
+        vectorizer (HashingVectorizer or Pipeline): The vectorizer returned by scan_dataset.
+        classes (array): The class labels.
+        model (str): Name of the linear model to use.
+        chunk_size (int): Number of rows read at a time.
+        test_size (float): Part of the dataset to include in the test split.
+        n_epochs (int): Number of passes over the training rows.
+
+    Returns:
+        object: The trained classifier.
+    """
+    classifier = make_classifier(model)
+
+    for epoch in range(n_epochs):
+        start_time = time.perf_counter()
+        n_rows = 0
+        for texts, labels, is_test in iter_chunks(dataset_path, chunk_size, test_size):
+            if (~is_test).any():
+                classifier.partial_fit(vectorizer.transform(texts[~is_test]), labels[~is_test], classes=classes)
+                n_rows += int((~is_test).sum())
+        elapsed = time.perf_counter() - start_time
+        print(f"Epoch {epoch + 1}/{n_epochs}: {n_rows} rows in {elapsed:.2f}s ({n_rows / elapsed:.0f} rows/sec)")
+    return classifier
+
+def evaluate_test_split(dataset_path, vectorizer, classifier, classes, chunk_size, test_size):
+    """
+    Predicts the labels of the testing rows one chunk at a time and adds them up in a confusion matrix,
+    so evaluation memory does not grow with the dataset either.
+
+    Parameters:
+        dataset_path (str): Path to the CSV dataset file.
+        vectorizer (HashingVectorizer or Pipeline): The vectorizer returned by scan_dataset.
+        classifier (object): The trained classifier.
+        classes (array): The class labels.
+        chunk_size (int): Number of rows read at a time.
+        test_size (float): Part of the dataset to include in the test split.
+
+    Returns:
+        array: Confusion matrix with true labels as rows and predicted labels as columns.
+    """
+    from sklearn import metrics
+
+    confusion = np.zeros((len(classes), len(classes)), dtype=np.int64)
+    for texts, labels, is_test in iter_chunks(dataset_path, chunk_size, test_size):
+        if is_test.any():
+            y_pred = classifier.predict(vectorizer.transform(texts[is_test]))
+            confusion += metrics.confusion_matrix(labels[is_test], y_pred, labels=classes)
+    return confusion
+
+def classification_report_from_confusion(confusion, classes, digits=2):
+    """
+    Builds a classification report in the same layout as sklearn's classification_report from a confusion matrix.
+
+    Parameters:
+        confusion (array): Confusion matrix with true labels as rows and predicted labels as columns.
+        classes (array): The class labels.
+        digits (int): Number of digits for the scores.
+
+    Returns:
+        str: The classification report.
+    """
+    true_positives = np.diag(confusion).astype(float)
+    support = confusion.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.nan_to_num(true_positives / confusion.sum(axis=0))
+        recall = np.nan_to_num(true_positives / support)
+        f1 = np.nan_to_num(2 * precision * recall / (precision + recall))
+    total = support.sum()
+
+    width = max(len('weighted avg'), *(len(label) for label in classes))
+    report = ("{:>{width}s} " + " {:>9}" * 4).format('', 'precision', 'recall', 'f1-score', 'support', width=width) + "\n\n"
+    row_fmt = "{:>{width}s} " + " {:>9.{digits}f}" * 3 + " {:>9}\n"
+    for i, label in enumerate(classes):
+        report += row_fmt.format(label, precision[i], recall[i], f1[i], support[i], width=width, digits=digits)
+    report += "\n"
+    report += ("{:>{width}s} " + " {:>9}" * 2 + " {:>9.{digits}f} {:>9}\n").format(
+        'accuracy', '', '', true_positives.sum() / total, total, width=width, digits=digits)
+    report += row_fmt.format('macro avg', precision.mean(), recall.mean(), f1.mean(), total, width=width, digits=digits)
+    report += row_fmt.format('weighted avg', np.average(precision, weights=support), np.average(recall, weights=support),
+                             np.average(f1, weights=support), total, width=width, digits=digits)
+    return report
+
+def save_models(classifier, vectorizer, model, model_dir):
+    """
+    Saves the trained classifier and vectorizer.
+
+    Parameters:
+        classifier (object): The trained classifier.
+        vectorizer (HashingVectorizer or Pipeline): The vectorizer.
+        model (str): Name of the linear model.
+        model_dir (str): Directory to save the models.
+    """
+    from joblib import dump
+
+    os.makedirs(model_dir, exist_ok=True)
+    classifier_path = os.path.join(model_dir, f'streaming_{model}_classifier.joblib')
+    vectorizer_path = os.path.join(model_dir, f'vectorizer_streaming_{model}.joblib')
+    dump(classifier, classifier_path)
+    dump(vectorizer, vectorizer_path)
+    print(f"Model saved at: {classifier_path}")
+    print(f"Vectorizer saved at: {vectorizer_path}")
+
+def save_report(confusion, classes, model, output_dir):
+    """
+    Saves the classification report to a text file.
+
+    Parameters:
+        confusion (array): Confusion matrix of the test data.
+        classes (array): The class labels.
+        model (str): Name of the linear model.
+        output_dir (str): Directory to save the report.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    class_report = classification_report_from_confusion(confusion, classes)
+    report_path = os.path.join(output_dir, f'streaming_{model}_report.txt')
+    with open(report_path, 'w') as report_file:
+        report_file.write(class_report)
+    print(f"Report saved at: {report_path}")
+
+#####
+# Main Function
+#####
+
+def main():
+    args = parse_args()
+    from codecarbon import EmissionsTracker
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    tracker = EmissionsTracker(
+        project_name="text_classification_benchmarks",
+        experiment_id=f"streaming_{args.model}",
+        output_dir=args.output_dir,
+        output_file=f"emissions_streaming_{args.model}.csv"
+    )
+    tracker.start()
+
+    tracker.start_task("scan_dataset")
+    classes, vectorizer = scan_dataset(args.dataset_path, args.chunk_size, args.test_size, args.n_features, args.idf)
+    tracker.stop_task()
+
+    tracker.start_task("train_classifier")
+    classifier = train_classifier(args.dataset_path, vectorizer, classes, args.model, args.chunk_size, args.test_size, args.n_epochs)
+    tracker.stop_task()
+
+    tracker.start_task("save_models")
+    save_models(classifier, vectorizer, args.model, args.model_dir)
+    tracker.stop_task()
+
+    tracker.start_task(f"predict_and_save_report_streaming_{args.model}")
+    confusion = evaluate_test_split(args.dataset_path, vectorizer, classifier, classes, args.chunk_size, args.test_size)
+    save_report(confusion, classes, args.model, args.output_dir)
+    tracker.stop_task()
+
+    tracker.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#####
+# Assignment 2 - Text Classification Benchmarks
+# Parallel hyperparameter sweep over the logistic regression and neural network classifiers
+#####
+
+# Importing packages
+import os
+import argparse
+import itertools
+from benchmark import parse_layer_sizes, start_tracker, load_features, benchmark_estimators, results_table
+
+# Defining argument parsing
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run a parallel hyperparameter sweep over the text classifiers.')
+    parser.add_argument('--dataset_path', type=str, required=True, help='Path to the CSV dataset file')
+    parser.add_argument('--output_dir', type=str, default='../out', help='Output directory for the results table and emission files')
+    parser.add_argument('--feature_store', type=str, default='../features', help='Directory where vectorized splits are stored and reused between runs')
+    parser.add_argument('--no_feature_store', action='store_true', help='Always load and vectorize the dataset from scratch')
+    parser.add_argument('--models', type=str, nargs='+', choices=['logreg', 'neural'], default=['logreg', 'neural'], help='Classifiers to include in the sweep')
+    parser.add_argument('--test_size', type=float, default=0.2, help='Part of the dataset to include in the test split')
+    parser.add_argument('--max_features', type=int, nargs='+', default=[500], help='Values of the max number of features for the vectorizer')
+    parser.add_argument('--C', type=float, nargs='+', default=[1.0], help='Values of the inverse regularisation strength of the logistic regression')
+    parser.add_argument('--hidden_layer_sizes', type=parse_layer_sizes, nargs='+', default=[(20,)], help='Hidden layer sizes of the neural network, e.g. 20 50,20')
+    parser.add_argument('--activation', type=str, nargs='+', default=['logistic'], help='Activation functions of the neural network')
+    parser.add_argument('--max_iter', type=int, nargs='+', default=[1000], help='Max numbers of iterations of the neural network')
+    parser.add_argument('--n_jobs', type=int, default=os.cpu_count(), help='Number of worker processes')
+    return parser.parse_args()
+
+#####
+# Defining Functions
+#####
+
+def build_grid(args):
+    """
+    Builds the list of configurations to evaluate from the command line arguments.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        list of dict: One configuration per model and combination of hyperparameters.
+    """
+    grid = []
+    if 'logreg' in args.models:
+        for max_features, C in itertools.product(args.max_features, args.C):
+            grid.append({'model': 'logreg', 'max_features': max_features, 'C': C})
+    if 'neural' in args.models:
+        for max_features, hidden_layer_sizes, activation, max_iter in itertools.product(
+                args.max_features, args.hidden_layer_sizes, args.activation, args.max_iter):
+            grid.append({'model': 'neural', 'max_features': max_features, 'hidden_layer_sizes': hidden_layer_sizes,
+                         'activation': activation, 'max_iter': max_iter})
+    return grid
+
+#####
+# Main Function
+#####
+
+def main():
+    args = parse_args()
+    tracker = start_tracker("hyperparameter_sweep", args.output_dir, "emissions_sweep.csv")
+
+    datasets = {}
+    for max_features in args.max_features:
+        X_train_features, X_test_features, y_train, y_test, _ = load_features(args, tracker, max_features)
+        datasets[max_features] = (X_train_features, X_test_features, y_train, y_test)
+
+    grid = build_grid(args)
+    print(f"Evaluating {len(grid)} configurations on {args.n_jobs} worker processes...")
+    if args.n_jobs > 1:
+        tracker.start_task("hyperparameter_sweep")
+    _, results = benchmark_estimators(grid, datasets, args.n_jobs, tracker)
+    if args.n_jobs > 1:
+        tracker.stop_task()
+
+    tracker.stop()
+
+    df = results_table(results)
+    results_path = os.path.join(args.output_dir, 'sweep_results.csv')
+    df.to_csv(results_path, index=False)
+    print(f"Sweep results saved at: {results_path}")
+    best = df.loc[df['accuracy'].idxmax()]
+    print(f"Best configuration: {best[:best.index.get_loc('accuracy')].dropna().to_dict()} (accuracy {best['accuracy']:.4f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+######
+# Assignment 3 - Query Expansion with Word Embeddings
+# Approximate nearest-neighbour index over the normalised word vectors
+######
+
+# Importing packages
+import os
+import json
+import shutil
+import tempfile
+import time
+import numpy as np
+from embedding_store import can_replace
+
+# Arrays of an index directory, loaded memory-mapped; the vocabulary and metadata are kept in words.json and meta.json
+INDEX_FILES = ['centroids.npy', 'vectors.npy', 'ids.npy', 'offsets.npy']
+
+#####
+# Defining Functions
+#####
+
+def normalise(vectors):
+    """
+    Scales vectors to unit length so that dot products are cosine similarities.
+
+    Parameters:
+        vectors (array): The vectors, one per row.
+
+    Returns:
+        array: The unit-length vectors as float32.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def assign_lists(vectors, centroids, chunk_size=65536):
+    """
+    Assigns every vector to the centroid it has the highest cosine similarity with.
+
+    Parameters:
+        vectors (array): Unit-length vectors.
+        centroids (array): Unit-length centroids.
+        chunk_size (int): Number of vectors compared at a time, to bound memory.
+
+    Returns:
+        array: The list number of every vector.
+    """
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk_size):
+        assignments[start:start + chunk_size] = (vectors[start:start + chunk_size] @ centroids.T).argmax(axis=1)
+    return assignments
+
+def train_centroids(vectors, n_lists, n_iter=10, sample_size=100000, seed=42):
+    """
+    Clusters a sample of the vectors with spherical k-means.
+
+    Parameters:
+        vectors (array): Unit-length vectors.
+        n_lists (int): Number of clusters.
+        n_iter (int): Number of k-means iterations.
+        sample_size (int): Max number of vectors used for training.
+        seed (int): Seed of the random sample and initial centroids.
+
+    Returns:
+        array: The unit-length centroids.
+    """
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+
+    for _ in range(n_iter):
+        assignments = assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = np.bincount(assignments, minlength=n_lists) == 0
+        # Restart empty clusters from random sample vectors
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = normalise(sums)
+    return centroids
+
+def build_index(vectors, words, n_lists=None, n_iter=10, seed=42):
+    """
+    Builds an inverted-file index: the vectors are clustered, and the vectors of each cluster are stored
+    next to each other so that a query only scans the few clusters closest to it.
+
+    Parameters:
+        vectors (array): The word vectors, one per row.
+        words (list of str): The word of every row.
+        n_lists (int, optional): Number of clusters, defaults to the square root of the vocabulary size.
+        n_iter (int): Number of k-means iterations.
+        seed (int): Seed of the k-means initialisation.
+
+    Returns:
+        dict: The index arrays.
+    """
+    vectors = normalise(vectors)
+    n_lists = n_lists or int(np.sqrt(len(vectors)))
+    centroids = train_centroids(vectors, n_lists, n_iter, seed=seed)
+    assignments = assign_lists(vectors, centroids)
+
+    order = np.argsort(assignments, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+    return {
+        'centroids': centroids,
+        'vectors': vectors[order],
+        'ids': order.astype(np.int32),
+        'offsets': offsets.astype(np.int64),
+        'words': list(words),
+    }
+
+def save_index(index, index_dir, model_name):
+    """
+    Saves the index arrays as .npy files, so that they can be memory-mapped when loaded. The files are written
+    next to the index directory and swapped in as a whole, since load_index would otherwise accept a mix of the
+    arrays of an interrupted build and those of the previous index. Only an empty directory or a previous index
+    is replaced.
+
+    Parameters:
+        index (dict): The index arrays.
+        index_dir (str): Directory to save the index to.
+        model_name (str): Name of the embedding model the index was built from.
+    """
+    if not can_replace(index_dir):
+        raise ValueError(f"'{index_dir}' is not a nearest-neighbour index, refusing to overwrite it")
+
+    parent_dir = os.path.dirname(os.path.abspath(index_dir))
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+    for name in INDEX_FILES:
+        np.save(os.path.join(tmp_dir, name), index[name[:-4]])
+    with open(os.path.join(tmp_dir, 'words.json'), 'w') as words_file:
+        json.dump(index['words'], words_file)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as meta_file:
+        json.dump({'model': model_name, 'n_vectors': len(index['ids']), 'n_lists': len(index['centroids'])}, meta_file)
+
+    # Building the index takes a while, so other files may have been put in the directory in the meantime
+    if not can_replace(index_dir):
+        shutil.rmtree(tmp_dir)
+        raise ValueError(f"'{index_dir}' is not a nearest-neighbour index, refusing to overwrite it")
+    shutil.rmtree(index_dir, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, index_dir)
+    except OSError:
+        # A concurrent run saved its index first
+        shutil.rmtree(tmp_dir)
+
+class AnnIndex:
+    """
+    Approximate nearest-neighbour lookups by cosine similarity on an inverted-file index.
+    """
+
+    def __init__(self, index, n_probe=8):
+        self.centroids = index['centroids']
+        self.vectors = index['vectors']
+        self.ids = index['ids']
+        self.offsets = index['offsets']
+        self.words = index['words']
+        self.key_to_index = {word: i for i, word in enumerate(self.words)}
+        # Row of every word in the clustered vector matrix
+        self.positions = np.empty(len(self.ids), dtype=np.int64)
+        self.positions[self.ids] = np.arange(len(self.ids))
+        self.n_probe = n_probe
+
+    @classmethod
+    def load(cls, index_dir, model_name, n_probe=8):
+        """
+        Loads a saved index with memory-mapped arrays.
+
+        Parameters:
+            index_dir (str): Directory of the saved index.
+            model_name (str): Name of the embedding model the index must be built from.
+            n_probe (int): Number of clusters scanned per query.
+
+        Returns:
+            AnnIndex or None: The index, or None if there is no index for this model in the directory.
+        """
+        meta_path = os.path.join(index_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as meta_file:
+            if json.load(meta_file)['model'] != model_name:
+                return None
+        index = {name[:-4]: np.load(os.path.join(index_dir, name), mmap_mode='r') for name in INDEX_FILES}
+        with open(os.path.join(index_dir, 'words.json')) as words_file:
+            index['words'] = json.load(words_file)
+        return cls(index, n_probe)
+
+    def vector(self, word):
+        """
+        Returns the unit-length vector of a word.
+
+        Parameters:
+            word (str): The word to look up.
+
+        Returns:
+            array: The vector of the word.
+        """
+        return self.vectors[self.positions[self.key_to_index[word]]]
+
+    def search(self, query_vectors, topn=10, exclude=None):
+        """
+        Finds the approximate top-n most similar words of every query vector.
+
+        Parameters:
+            query_vectors (array): Query vectors, one per row.
+            topn (int): Number of similar words to return per query.
+            exclude (list of int, optional): Vocabulary index to leave out of the results of each query, e.g. the query word itself.
+
+        Returns:
+            list of list of tuple: The (word, similarity) pairs of every query, most similar first.
+        """
+        query_vectors = normalise(np.atleast_2d(query_vectors))
+        probes = np.argsort(-(query_vectors @ self.centroids.T), axis=1)[:, :self.n_probe]
+
+        results = []
+        for i, query in enumerate(query_vectors):
+            ranges = [(self.offsets[list_id], self.offsets[list_id + 1]) for list_id in probes[i]]
+            scores = np.concatenate([self.vectors[start:end] @ query for start, end in ranges])
+            ids = np.concatenate([self.ids[start:end] for start, end in ranges])
+            if exclude is not None:
+                scores[ids == exclude[i]] = -np.inf
+            k = min(topn, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results.append([(self.words[ids[j]], float(scores[j])) for j in top if np.isfinite(scores[j])])
+        return results
+
+    def most_similar(self, words, topn=10):
+        """
+        Finds the approximate top-n most similar words of every query word, leaving out the query word itself.
+
+        Parameters:
+            words (str or list of str): The query word(s).
+            topn (int): Number of similar words to return per query word.
+
+        Returns:
+            list of tuple, or list of lists of tuples: The (word, similarity) pairs, one list per query word if a list was given.
+        """
+        single = isinstance(words, str)
+        words = [words] if single else list(words)
+        ids = [self.key_to_index[word] for word in words]
+        results = self.search(np.stack([self.vector(word) for word in words]), topn, exclude=ids)
+        return results[0] if single else results
+
+def measure_recall(index, n_words=200, topn=10, seed=42):
+    """
+    Compares the approximate lookups with an exact brute-force scan over all vectors.
+
+    Parameters:
+        index (AnnIndex): The index to evaluate.
+        n_words (int): Number of randomly drawn query words.
+        topn (int): Number of similar words per query.
+        seed (int): Seed of the query word sample.
+
+    Returns:
+        dict: Recall@topn and the time per word of the approximate and exact lookups in milliseconds.
+    """
+    rng = np.random.default_rng(seed)
+    words = [index.words[i] for i in rng.choice(len(index.words), n_words, replace=False)]
+
+    start_time = time.perf_counter()
+    approximate = index.most_similar(words, topn)
+    ann_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    hits = 0
+    for word, neighbours in zip(words, approximate):
+        scores = index.vectors @ index.vector(word)
+        scores[index.ids == index.key_to_index[word]] = -np.inf
+        exact = {index.words[index.ids[j]] for j in np.argpartition(-scores, topn)[:topn]}
+        hits += len(exact & {neighbour for neighbour, _ in neighbours})
+    exact_time = time.perf_counter() - start_time
+
+    return {
+        f'recall@{topn}': hits / (n_words * topn),
+        'ann_ms_per_word': ann_time / n_words * 1000,
+        'exact_ms_per_word': exact_time / n_words * 1000,
+    }
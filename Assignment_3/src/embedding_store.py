@@ -0,0 +1,151 @@
+######
+# Assignment 3 - Query Expansion with Word Embeddings
+# Local, memory-mapped store of the pretrained word vectors
+######
+
+# Importing packages
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+
+#####
+# Defining Functions
+#####
+
+def can_replace(store_dir):
+    """
+    Checks whether a directory can be replaced by a newly written store, i.e. the embedding store or the
+    nearest-neighbour index: it does not exist, is empty, or holds a previous store, recognised by its meta.json.
+
+    Parameters:
+        store_dir (str): Directory of the store.
+
+    Returns:
+        bool: Whether the directory can be replaced.
+    """
+    if not os.path.exists(store_dir):
+        return True
+    return os.path.isdir(store_dir) and (not os.listdir(store_dir) or os.path.exists(os.path.join(store_dir, 'meta.json')))
+
+def convert_model(model, store_dir, model_name, dtype='float32'):
+    """
+    Converts a Gensim model into the embedding store: a vector matrix and its row norms as .npy files
+    and the vocabulary as JSON. The vectors take a while to write, so they go into a sibling folder that
+    replaces the store directory only when complete. Only an empty directory or a previous store is
+    replaced; any other directory is left alone.
+
+    Parameters:
+        model (Gensim model): The word embedding model.
+        store_dir (str): Directory of the embedding store.
+        model_name (str): Name of the embedding model.
+        dtype (str): Data type of the stored vectors ('float32' or 'float16').
+    """
+    if not can_replace(store_dir):
+        raise ValueError(f"'{store_dir}' is not an embedding store, refusing to overwrite it")
+
+    parent_dir = os.path.dirname(os.path.abspath(store_dir))
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+
+    vectors = np.asarray(model.vectors, dtype=dtype)
+    np.save(os.path.join(tmp_dir, 'vectors.npy'), vectors)
+    np.save(os.path.join(tmp_dir, 'norms.npy'), np.linalg.norm(vectors.astype(np.float32), axis=1))
+    with open(os.path.join(tmp_dir, 'words.json'), 'w') as words_file:
+        json.dump(list(model.index_to_key), words_file)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as meta_file:
+        json.dump({'model': model_name, 'dtype': dtype, 'n_vectors': len(vectors), 'vector_size': vectors.shape[1]}, meta_file)
+
+    # Checked again, as the directory may have changed while the store was written
+    if not can_replace(store_dir):
+        shutil.rmtree(tmp_dir)
+        raise ValueError(f"'{store_dir}' is not an embedding store, refusing to overwrite it")
+    shutil.rmtree(store_dir, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, store_dir)
+    except OSError:
+        # Another run stored the same model in the meantime
+        shutil.rmtree(tmp_dir)
+
+class EmbeddingStore:
+    """
+    Word vectors memory-mapped from the embedding store, with the lookups the script needs from a Gensim model.
+    Processes that open the same store share its pages, and nothing is downloaded or deserialised.
+    """
+
+    def __init__(self, vectors, norms, words):
+        self.vectors = vectors
+        self.norms = norms
+        self.index_to_key = words
+        self.key_to_index = {word: i for i, word in enumerate(words)}
+
+    @classmethod
+    def load(cls, store_dir, model_name, dtype='float32'):
+        """
+        Opens the embedding store with memory-mapped vectors.
+
+        Parameters:
+            store_dir (str): Directory of the embedding store.
+            model_name (str): Name of the embedding model the store must hold.
+            dtype (str): Data type the vectors must be stored in.
+
+        Returns:
+            EmbeddingStore or None: The store, or None if the directory holds no store of this model and data type.
+        """
+        meta_path = os.path.join(store_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        if meta['model'] != model_name or meta['dtype'] != dtype:
+            return None
+        with open(os.path.join(store_dir, 'words.json')) as words_file:
+            words = json.load(words_file)
+        return cls(
+            np.load(os.path.join(store_dir, 'vectors.npy'), mmap_mode='r'),
+            np.load(os.path.join(store_dir, 'norms.npy'), mmap_mode='r'),
+            words
+        )
+
+    def __contains__(self, word):
+        return word in self.key_to_index
+
+    def get_vector(self, word):
+        """
+        Returns the vector of a word.
+
+        Parameters:
+            word (str): The word to look up.
+
+        Returns:
+            array: The vector of the word as float32.
+        """
+        if word not in self.key_to_index:
+            raise KeyError(f"Key '{word}' not present")
+        return np.asarray(self.vectors[self.key_to_index[word]], dtype=np.float32)
+
+    def most_similar(self, word, topn=10, chunk_size=65536):
+        """
+        Finds the words with the highest cosine similarity to a word by an exact scan over all vectors.
+
+        Parameters:
+            word (str): The word to look up.
+            topn (int): Number of similar words to return.
+            chunk_size (int): Number of vectors compared at a time, to bound memory.
+
+        Returns:
+            list of tuple: The (word, similarity) pairs, most similar first, without the word itself.
+        """
+        query = self.get_vector(word)
+        query = query / np.linalg.norm(query)
+        scores = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(self.vectors), chunk_size):
+            chunk = np.asarray(self.vectors[start:start + chunk_size], dtype=np.float32)
+            scores[start:start + chunk_size] = chunk @ query
+        scores /= np.maximum(self.norms, 1e-12)
+        scores[self.key_to_index[word]] = -np.inf
+
+        top = np.argpartition(-scores, topn)[:topn]
+        top = top[np.argsort(-scores[top])]
+        return [(self.index_to_key[i], float(scores[i])) for i in top]
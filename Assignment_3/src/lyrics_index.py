@@ -0,0 +1,166 @@
+######
+# Assignment 3 - Query Expansion with Word Embeddings
+# Persisted inverted index from artists and lyric tokens to songs
+######
+
+# Importing packages
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Arrays of an index entry, loaded memory-mapped; the artist names and tokens are kept in JSON
+INDEX_FILES = ['token_postings.npy', 'token_offsets.npy', 'artist_postings.npy', 'artist_offsets.npy']
+
+#####
+# Defining Functions
+#####
+
+def build_postings(song_ids, keys):
+    """
+    Groups song ids by key into one sorted array of song ids per key. Pairs with a missing key,
+    e.g. a song without an artist, are left out.
+
+    Parameters:
+        song_ids (array): Song id of every (song, key) pair.
+        keys (Series): Key of every pair, e.g. a token or an artist name.
+
+    Returns:
+        tuple: The keys, the concatenated postings, and the offsets of each key's postings.
+    """
+    codes, uniques = pd.factorize(keys, sort=True)
+    pairs = pd.DataFrame({'key': codes, 'song': song_ids})
+    pairs = pairs[pairs['key'] >= 0].drop_duplicates().sort_values(['key', 'song'])
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(pairs['key'], minlength=len(uniques)))])
+    return list(uniques), pairs['song'].to_numpy(dtype=np.int32), offsets.astype(np.int64)
+
+def build_index(df):
+    """
+    Builds the inverted index of the preprocessed songs: the songs of every artist (case-insensitive)
+    and the songs containing every token of the lyrics.
+
+    Parameters:
+        df (DataFrame): The preprocessed songs dataset.
+
+    Returns:
+        dict: The index arrays, artist names, and tokens.
+    """
+    tokens = df['text'].reset_index(drop=True).str.split().explode().dropna()
+    token_keys, token_postings, token_offsets = build_postings(tokens.index.to_numpy(), tokens)
+    artist_keys, artist_postings, artist_offsets = build_postings(np.arange(len(df)), df['artist'].str.lower().reset_index(drop=True))
+    return {
+        'tokens': token_keys,
+        'token_postings': token_postings,
+        'token_offsets': token_offsets,
+        'artists': artist_keys,
+        'artist_postings': artist_postings,
+        'artist_offsets': artist_offsets,
+    }
+
+def save_index(index, index_dir, key):
+    """
+    Saves the index as an entry of the index directory, named after the dataset hash. LyricsIndex.load only
+    checks that the entry folder exists, so the arrays are written under a temporary name that is renamed to
+    the key once they are all there.
+
+    Parameters:
+        index (dict): The index arrays, artist names, and tokens.
+        index_dir (str): Directory of the index entries.
+        key (str): Key of the entry, i.e. the hash of the dataset.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=index_dir)
+    for name in INDEX_FILES:
+        np.save(os.path.join(tmp_dir, name), index[name[:-4]])
+    with open(os.path.join(tmp_dir, 'keys.json'), 'w') as keys_file:
+        json.dump({'tokens': index['tokens'], 'artists': index['artists']}, keys_file)
+    try:
+        os.rename(tmp_dir, os.path.join(index_dir, key))
+    except OSError:
+        # Another run stored the same entry in the meantime
+        shutil.rmtree(tmp_dir)
+
+class LyricsIndex:
+    """
+    Looks up the songs of an artist and the songs containing a token as sorted arrays of song ids,
+    so that percentage queries become set operations instead of scans over the lyrics.
+    """
+
+    def __init__(self, index):
+        self.token_postings = index['token_postings']
+        self.token_offsets = index['token_offsets']
+        self.artist_postings = index['artist_postings']
+        self.artist_offsets = index['artist_offsets']
+        self.token_ids = {token: i for i, token in enumerate(index['tokens'])}
+        self.artist_ids = {artist: i for i, artist in enumerate(index['artists'])}
+
+    @classmethod
+    def load(cls, index_dir, key):
+        """
+        Loads an index entry with memory-mapped arrays.
+
+        Parameters:
+            index_dir (str): Directory of the index entries.
+            key (str): Key of the entry, i.e. the hash of the dataset.
+
+        Returns:
+            LyricsIndex or None: The index, or None if the entry does not exist.
+        """
+        entry_dir = os.path.join(index_dir, key)
+        if not os.path.isdir(entry_dir):
+            return None
+        index = {name[:-4]: np.load(os.path.join(entry_dir, name), mmap_mode='r') for name in INDEX_FILES}
+        with open(os.path.join(entry_dir, 'keys.json')) as keys_file:
+            index.update(json.load(keys_file))
+        return cls(index)
+
+    def artist_songs(self, artist):
+        """
+        Returns the songs of an artist.
+
+        Parameters:
+            artist (str): Name of the artist, case-insensitive.
+
+        Returns:
+            array: Sorted song ids.
+        """
+        i = self.artist_ids.get(artist.lower())
+        if i is None:
+            return np.empty(0, dtype=np.int32)
+        return self.artist_postings[self.artist_offsets[i]:self.artist_offsets[i + 1]]
+
+    def token_songs(self, token):
+        """
+        Returns the songs whose lyrics contain a token.
+
+        Parameters:
+            token (str): The token, as it appears in the preprocessed lyrics.
+
+        Returns:
+            array: Sorted song ids.
+        """
+        i = self.token_ids.get(token)
+        if i is None:
+            return np.empty(0, dtype=np.int32)
+        return self.token_postings[self.token_offsets[i]:self.token_offsets[i + 1]]
+
+    def calc_perc(self, artist, query_words):
+        """
+        Calculates the percentage of songs by an artist that contain any of the query words as a whole token.
+
+        Parameters:
+            artist (str): The name of the artist to inspect.
+            query_words (list): A list of words to search for in the songs.
+
+        Returns:
+            float: The percentage of songs by the artist that contain any of the query words.
+        """
+        artist_songs = self.artist_songs(artist)
+        if len(artist_songs) == 0:
+            return 0
+        relevant = np.zeros(len(artist_songs), dtype=bool)
+        for word in query_words:
+            relevant |= np.isin(artist_songs, self.token_songs(word.lower()), assume_unique=True)
+        return relevant.sum() / len(artist_songs) * 100
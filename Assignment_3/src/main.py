@@ -7,19 +7,44 @@
 # Importing packages
 import os
 import argparse
+import functools
+import hashlib
+import itertools
+import numpy as np
 import pandas as pd
-import gensim.downloader as api
 import string
-from codecarbon import EmissionsTracker
+import sys
+import time
+
+# Pretrained word embedding model
+MODEL_NAME = "glove-wiki-gigaword-50"
 
 # Defining argument parsing
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Query expansion with word embeddings.")
     parser.add_argument('--dataset_path', type=str, required=True, help='Path to the dataset file')
     parser.add_argument('--output_dir', type=str, default='../out', help='Output directory for the resulting text files and emission files')    
-    parser.add_argument('--artist', type=str, required=True, help='The music artist(s) to inspect')
-    parser.add_argument('--word', type=str, required=True, help='The search word to expand')
-    return parser.parse_args()
+    parser.add_argument('--artist', type=str, default=None, help='The music artist(s) to inspect')
+    parser.add_argument('--word', type=str, default=None, help='The search word to expand')
+    parser.add_argument('--queries', type=str, default=None, help='CSV file with artist and word columns to answer in one batch')
+    parser.add_argument('--artists', type=str, nargs='+', default=None, help='Artists to combine with every word of --words in one batch')
+    parser.add_argument('--words', type=str, nargs='+', default=None, help='Search words to combine with every artist of --artists in one batch')
+    parser.add_argument('--cache_dir', type=str, default='../cache', help='Directory where the preprocessed lyrics are cached as Parquet files')
+    parser.add_argument('--no_cache', action='store_true', help='Always load and preprocess the CSV file from scratch')
+    parser.add_argument('--embedding_dir', type=str, default='../embeddings', help='Directory where the word vectors are stored for memory-mapped loading')
+    parser.add_argument('--embedding_dtype', type=str, choices=['float32', 'float16'], default='float32', help='Data type of the stored word vectors')
+    parser.add_argument('--no_embedding_store', action='store_true', help='Always load the word vectors with Gensim instead of the local store')
+    parser.add_argument('--relevance', action='store_true', help='Also score every song by the mean and max cosine similarity of its words to the search word')
+    parser.add_argument('--use_index', action='store_true', help='Count the songs with the persisted inverted index of whole lyric tokens instead of substring matching')
+    parser.add_argument('--lyrics_index_dir', type=str, default='../lyrics_index', help='Directory where the inverted lyrics index is stored and reused between runs')
+    parser.add_argument('--use_ann', action='store_true', help='Expand the query with the approximate nearest-neighbour index instead of a full scan')
+    parser.add_argument('--index_dir', type=str, default='../index', help='Directory where the nearest-neighbour index is stored and reused between runs')
+    parser.add_argument('--n_probe', type=int, default=8, help='Number of index clusters scanned per query word')
+    parser.add_argument('--measure_recall', type=int, default=0, help='Number of random words to compare the index against exact lookups with')
+    args = parser.parse_args()
+    if not (args.artist and args.word) and not args.queries and not (args.artists and args.words):
+        parser.error("specify --artist and --word, --queries, or --artists and --words")
+    return args
 
 ##### 
 # Defining Functions
@@ -39,41 +64,259 @@ def preprocess_text(text):
     text = text.translate(str.maketrans('', '', string.punctuation))
     return text
 
-def load_data(filepath):
+def preprocess_texts(texts):
+    """
+    Preprocesses a column of texts like preprocess_text, but in a few passes over the whole column instead of one
+    Python call per text. The texts are joined into one string, lowercased, and stripped of punctuation as UTF-8 bytes
+    (the punctuation characters are ASCII and never occur inside multi-byte characters), and then split up again.
+
+    Parameters:
+        texts (Series): The texts to preprocess.
+
+    Returns:
+        Series: The preprocessed texts.
+    """
+    texts = texts.fillna('')
+    joined = '\x00'.join(texts.tolist())
+    if joined.count('\x00') != len(texts) - 1:
+        # A text contains the separator itself
+        return texts.apply(preprocess_text)
+    cleaned = joined.lower().encode('utf-8').translate(None, string.punctuation.encode()).decode('utf-8')
+    return pd.Series(cleaned.split('\x00'), index=texts.index)
+
+def dataset_key(filepath):
+    """
+    Names the cached data and the lyrics index of a dataset after its content, so both are rebuilt when the CSV file changes.
+
+    Parameters:
+        filepath (str): Path to the CSV file.
+
+    Returns:
+        str: The first 16 hexadecimal digits of the SHA-256 hash of the file.
+    """
+    with open(filepath, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()[:16]
+
+def load_data(filepath, cache_dir=None):
     """
-    Loads data from a CSV file and preprocesses the 'text' column.
+    Loads data from a CSV file and preprocesses the 'text' column. With a cache directory, the preprocessed data is
+    saved as a Parquet file named after the hash of the CSV file, and loaded from there on later runs.
 
     Parameters:
         filepath (str): Path to the CSV file.
+        cache_dir (str, optional): Directory of the preprocessed data cache, or None to always preprocess the CSV file.
 
     Returns:
         DataFrame: Loaded and preprocessed data.
     """
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, f"{dataset_key(filepath)}.parquet")
+        if os.path.exists(cache_path):
+            return pd.read_parquet(cache_path)
+
     df = pd.read_csv(filepath)
-    df['text'] = df['text'].apply(preprocess_text)
+    df['text'] = preprocess_texts(df['text'])
+    df['artist'] = df['artist'].astype('category')
+
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
     return df
 
-def load_model():
+@functools.lru_cache(maxsize=None)
+def load_model(embedding_dir=None, dtype='float32'):
+    """
+    Loads the pretrained word embedding model, memory-mapped from the local embedding store.
+    The first time, the model is downloaded with Gensim and converted into the store; without an
+    embedding directory, the Gensim model is loaded as is. The model is cached for the rest of the process.
+
+    Parameters:
+        embedding_dir (str, optional): Directory of the embedding store, or None to always load the model with Gensim.
+        dtype (str): Data type of the stored vectors ('float32' or 'float16').
+
+    Returns:
+        EmbeddingStore or Gensim model: Pretrained word embedding model.
+    """
+    from embedding_store import EmbeddingStore, can_replace, convert_model
+
+    if embedding_dir:
+        store = EmbeddingStore.load(embedding_dir, MODEL_NAME, dtype)
+        if store is not None:
+            return store
+        if not can_replace(embedding_dir):
+            raise SystemExit(f"Embedding directory '{embedding_dir}' holds other files, choose another --embedding_dir")
+
+    import gensim.downloader as api
+
+    model = api.load(MODEL_NAME)
+    if not embedding_dir:
+        return model
+    convert_model(model, embedding_dir, MODEL_NAME, dtype)
+    print(f"Converted {MODEL_NAME} into the embedding store at {embedding_dir}")
+    return EmbeddingStore.load(embedding_dir, MODEL_NAME, dtype)
+
+def load_index(model, index_dir, n_probe):
     """
-    Loads a pretrained word embedding model from Gensim.
+    Loads the approximate nearest-neighbour index of the model, or builds and saves it if it does not exist yet.
+
+    Parameters:
+        model (Gensim model): The word embedding model.
+        index_dir (str): Directory where the index is stored.
+        n_probe (int): Number of index clusters scanned per query word.
 
     Returns:
-        Gensim model: Pretrained word embedding model.
+        AnnIndex: The memory-mapped index.
+    """
+    from ann_index import AnnIndex, build_index, save_index
+
+    index = AnnIndex.load(index_dir, MODEL_NAME, n_probe)
+    if index is None:
+        start_time = time.perf_counter()
+        try:
+            save_index(build_index(model.vectors, model.index_to_key), index_dir, MODEL_NAME)
+        except ValueError:
+            raise SystemExit(f"Index directory '{index_dir}' holds other files, choose another --index_dir")
+        print(f"Built nearest-neighbour index in {time.perf_counter() - start_time:.1f}s and saved it to {index_dir}")
+        index = AnnIndex.load(index_dir, MODEL_NAME, n_probe)
+    return index
+
+def load_lyrics_index(dataset_path, index_dir, cache_dir=None):
     """
-    return api.load("glove-wiki-gigaword-50")
+    Loads the inverted lyrics index of the dataset, or loads and preprocesses the dataset and builds and saves the index
+    if it does not exist yet. Index entries are keyed by the hash of the dataset, so a changed dataset gets a new index.
 
-def expand_query(model, word):
+    Parameters:
+        dataset_path (str): Path to the CSV file.
+        index_dir (str): Directory where the index entries are stored.
+        cache_dir (str, optional): Directory of the preprocessed data cache.
+
+    Returns:
+        LyricsIndex: The memory-mapped index.
+    """
+    from lyrics_index import LyricsIndex, build_index, save_index
+
+    key = dataset_key(dataset_path)
+    index = LyricsIndex.load(index_dir, key)
+    if index is None:
+        start_time = time.perf_counter()
+        save_index(build_index(load_data(dataset_path, cache_dir)), index_dir, key)
+        print(f"Built inverted lyrics index in {time.perf_counter() - start_time:.1f}s and saved it to {os.path.join(index_dir, key)}")
+        index = LyricsIndex.load(index_dir, key)
+    return index
+
+def expand_query(model, word, index=None):
     """
     Expands the query by finding similar words using word embeddings.
 
     Parameters:
         model (Gensim model): The word embedding model.
         word (str): The target word to expand.
+        index (AnnIndex, optional): Nearest-neighbour index to look the similar words up in instead of scanning the model.
 
     Returns:
         list: A list containing the original word and its similar words.
     """
-    return [word] + [result[0] for result in model.most_similar(word)]
+    similar = index.most_similar(word) if index else model.most_similar(word)
+    return [word] + [result[0] for result in similar]
+
+def expand_queries(model, words, topn=10, index=None, chunk_size=65536):
+    """
+    Expands many query words at once. The similarities of all query words to the vocabulary are
+    computed with one matrix multiplication per chunk of the vocabulary. Words that are not in the
+    vocabulary are not expanded.
+
+    Parameters:
+        model (EmbeddingStore or Gensim model): The word embedding model.
+        words (list of str): The target words to expand.
+        topn (int): Number of similar words per target word.
+        index (AnnIndex, optional): Nearest-neighbour index to look the similar words up in instead of scanning the model.
+        chunk_size (int): Number of vocabulary vectors compared at a time, to bound memory.
+
+    Returns:
+        dict: The original word and its similar words, keyed by target word.
+    """
+    known = [word for word in words if word in model.key_to_index]
+    for word in sorted(set(words) - set(known)):
+        print(f"Warning: '{word}' is not in the vocabulary of {MODEL_NAME} and is not expanded", file=sys.stderr)
+    expansions = {word: [word] for word in words}
+    if not known:
+        return expansions
+
+    if index:
+        for word, similar in zip(known, index.most_similar(known, topn)):
+            expansions[word] = [word] + [result[0] for result in similar]
+        return expansions
+
+    ids = np.array([model.key_to_index[word] for word in known])
+    queries = np.asarray(model.vectors[ids], dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    # Best candidates so far, merged with the best candidates of every chunk
+    best_scores = np.empty((len(known), 0), dtype=np.float32)
+    best_ids = np.empty((len(known), 0), dtype=np.int64)
+    rows = np.arange(len(known))
+    for start in range(0, len(model.vectors), chunk_size):
+        chunk = np.asarray(model.vectors[start:start + chunk_size], dtype=np.float32)
+        scores = queries @ chunk.T / np.maximum(np.linalg.norm(chunk, axis=1), 1e-12)
+        in_chunk = (ids >= start) & (ids < start + len(chunk))
+        scores[rows[in_chunk], ids[in_chunk] - start] = -np.inf
+        k = min(topn, len(chunk))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.hstack([best_scores, np.take_along_axis(scores, top, axis=1)])
+        best_ids = np.hstack([best_ids, top + start])
+        top = np.argsort(-best_scores, axis=1)[:, :topn]
+        best_scores = np.take_along_axis(best_scores, top, axis=1)
+        best_ids = np.take_along_axis(best_ids, top, axis=1)
+
+    order = np.argsort(-best_scores, axis=1)
+    for word, row in zip(known, np.take_along_axis(best_ids, order, axis=1)):
+        expansions[word] = [word] + [model.index_to_key[i] for i in row]
+    return expansions
+
+def build_queries(args):
+    """
+    Builds the list of (artist, word) pairs to answer from the command line arguments.
+
+    Parameters:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        list of tuple: The (artist, word) pairs.
+    """
+    if args.queries:
+        queries = pd.read_csv(args.queries, usecols=['artist', 'word'], dtype=str)
+        return list(queries.itertuples(index=False, name=None))
+    if args.artists and args.words:
+        return list(itertools.product(args.artists, args.words))
+    return [(args.artist, args.word)]
+
+def save_batch_results(output_dir, results):
+    """
+    Saves the results of a batch of queries to one CSV table.
+
+    Parameters:
+        output_dir (str): Directory where the results table will be saved.
+        results (list of dict): Artist, word, percentage, and similar words of every query.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    output_file = os.path.join(output_dir, "batch_results.csv")
+    pd.DataFrame(results).to_csv(output_file, index=False)
+    print(f"Results saved to {output_file}")
+
+def artist_songs(df, artists):
+    """
+    Selects the songs of the given artists (case-insensitive).
+
+    Parameters:
+        df (DataFrame): The dataframe containing the songs dataset.
+        artists (list of str): The names of the artists.
+
+    Returns:
+        DataFrame: The songs of the artists.
+    """
+    return df[df['artist'].str.lower().isin([artist.lower() for artist in artists])]
 
 def calc_perc(df, artist, query_words):
     """
@@ -97,9 +340,9 @@ def calc_perc(df, artist, query_words):
         percentage = 0
     return percentage
 
-def save_results(output_dir, artist, word, percentage, similar_words):
+def save_results(output_dir, artist, word, percentage, similar_words, relevance=None):
     """
-    Saves the analysis results to a text file.
+    Saves the analysis results to a text file, and the relevance of every song to a CSV file if it was scored.
 
     Parameters:
         output_dir (str): Directory where the results file will be saved.
@@ -107,6 +350,7 @@ def save_results(output_dir, artist, word, percentage, similar_words):
         word (str): The search word used for query expansion.
         percentage (float): Percentage of artist's songs that contain the related words.
         similar_words (list of str): List of words similar to the search word.
+        relevance (DataFrame, optional): Mean and max similarity of every song of the artist to the search word.
     """
     os.makedirs(output_dir, exist_ok=True)
 
@@ -117,14 +361,28 @@ def save_results(output_dir, artist, word, percentage, similar_words):
         file.write("\nBased on general language patterns, the words most similar to the specified term are:\n")
         file.write("\n".join(similar_words))
 
+        if relevance is not None and relevance['max_similarity'].notna().any():
+            relevance = relevance.sort_values('max_similarity', ascending=False)
+            file.write(f"\n\nOn average, the words of {artist}'s songs have a cosine similarity of {relevance['mean_similarity'].mean():.3f} to {word}, "
+                       f"and the most similar word of each song a similarity of {relevance['max_similarity'].mean():.3f}.\n")
+            file.write("The songs with the most similar words are:\n")
+            file.write("\n".join(f"{row.song} ({row.max_similarity:.3f})" for row in relevance.head(5).itertuples()))
+
     print(f"Results saved to {output_file}")
 
+    if relevance is not None:
+        relevance_file = os.path.join(output_dir, f"{artist.replace(' ', '_')}_{word.replace(' ', '_')}_relevance.csv")
+        relevance.to_csv(relevance_file, index=False)
+        print(f"Song relevance saved to {relevance_file}")
+
 #####
 # Main Function
 #####
 
 def main():
     args = parse_arguments()
+    from codecarbon import EmissionsTracker
+
     tracker = EmissionsTracker(
         project_name="query_expansion_embeddings",
         experiment_id="word_embeddings_usage",
@@ -133,29 +391,102 @@ def main():
     )
     tracker.start()
 
-    tracker.start_task("load_data")
-    df = load_data(args.dataset_path)
-    tracker.stop_task()
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.use_index:
+        tracker.start_task("load_lyrics_index")
+        lyrics_index = load_lyrics_index(args.dataset_path, args.lyrics_index_dir, cache_dir)
+        tracker.stop_task()
+    else:
+        tracker.start_task("load_data")
+        df = load_data(args.dataset_path, cache_dir)
+        tracker.stop_task()
+
+    if args.relevance and args.use_index:
+        tracker.start_task("load_data")
+        df = load_data(args.dataset_path, cache_dir)
+        tracker.stop_task()
 
     tracker.start_task("load_model")
-    model = load_model()
+    model = load_model(None if args.no_embedding_store else args.embedding_dir, args.embedding_dtype)
     tracker.stop_task()
 
-    tracker.start_task("expand_query")
-    query_words = expand_query(model, args.word)
+    index = None
+    if args.use_ann or args.measure_recall:
+        tracker.start_task("load_index")
+        index = load_index(model, args.index_dir, args.n_probe)
+        tracker.stop_task()
+
+    if args.measure_recall:
+        from ann_index import measure_recall
+
+        tracker.start_task("measure_recall")
+        print(f"Nearest-neighbour index vs. exact lookups: {measure_recall(index, args.measure_recall)}")
+        tracker.stop_task()
+
+    queries = build_queries(args)
+
+    if not (args.queries or (args.artists and args.words)):
+        artist, word = queries[0]
+        tracker.start_task("expand_query")
+        query_words = expand_query(model, word, index if args.use_ann else None)
+        tracker.stop_task()
+
+        tracker.start_task("calculate_percentage")
+        if args.use_index:
+            percentage = lyrics_index.calc_perc(artist, query_words)
+        else:
+            percentage = calc_perc(df, artist, query_words)
+        tracker.stop_task()
+
+        relevance = None
+        if args.relevance:
+            from relevance import score_songs
+
+            tracker.start_task("score_relevance")
+            relevance = score_songs(model, artist_songs(df, [artist]), [word])
+            tracker.stop_task()
+
+        tracker.start_task("save_results")
+        save_results(args.output_dir, artist, word, percentage, query_words[1:], relevance)
+        tracker.stop_task()
+
+        tracker.stop()
+        print(f"{percentage:.2f}% of {artist}'s songs contain words related to {word}")
+        return
+
+    tracker.start_task("expand_queries")
+    expansions = expand_queries(model, list(dict.fromkeys(word for _, word in queries)), index=index if args.use_ann else None)
     tracker.stop_task()
 
-    tracker.start_task("calculate_percentage")
-    percentage = calc_perc(df, args.artist, query_words)
+    tracker.start_task("calculate_percentages")
+    results = []
+    for artist, word in queries:
+        query_words = expansions[word]
+        if args.use_index:
+            percentage = lyrics_index.calc_perc(artist, query_words)
+        else:
+            percentage = calc_perc(df, artist, query_words)
+        results.append({'artist': artist, 'word': word, 'percentage': percentage, 'similar_words': ' '.join(query_words[1:])})
     tracker.stop_task()
 
+    if args.relevance:
+        from relevance import score_songs
+
+        tracker.start_task("score_relevance")
+        scores = score_songs(model, artist_songs(df, [artist for artist, _ in queries]), list(expansions))
+        scores = scores.groupby([scores['artist'].astype(str).str.lower(), 'word'])[['mean_similarity', 'max_similarity']].mean()
+        for result in results:
+            key = (result['artist'].lower(), result['word'])
+            result['mean_relevance'] = scores['mean_similarity'].get(key, np.nan)
+            result['max_relevance'] = scores['max_similarity'].get(key, np.nan)
+        tracker.stop_task()
+
     tracker.start_task("save_results")
-    similar_words = [word for word, _ in model.most_similar(args.word, topn=10)]
-    save_results(args.output_dir, args.artist, args.word, percentage, similar_words)
+    save_batch_results(args.output_dir, results)
     tracker.stop_task()
 
     tracker.stop()
-    print(f"{percentage:.2f}% of {args.artist}'s songs contain words related to {args.word}")
+    print(f"Answered {len(results)} queries")
 
 
 if __name__ == "__main__":
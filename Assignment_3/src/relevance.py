@@ -0,0 +1,118 @@
+######
+# Assignment 3 - Query Expansion with Word Embeddings
+# Graded relevance of songs to query words from sparse song-term matrices
+######
+
+# Importing packages
+import itertools
+import numpy as np
+import pandas as pd
+
+#####
+# Defining Functions
+#####
+
+def song_term_matrix(texts, key_to_index):
+    """
+    Builds a binary sparse matrix of which vocabulary words occur in which songs. Tokens that are not
+    in the vocabulary of the embedding model are left out. Every distinct token is looked up in the
+    vocabulary once, rather than once per occurrence.
+
+    Parameters:
+        texts (Series): The preprocessed lyrics, one song per row.
+        key_to_index (dict): Vocabulary index of every word of the embedding model.
+
+    Returns:
+        csr_matrix: Songs x vocabulary matrix.
+    """
+    from scipy import sparse
+
+    tokens = [text.split() for text in texts.fillna('').tolist()]
+    lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+    codes, uniques = pd.factorize(np.fromiter(itertools.chain.from_iterable(tokens), dtype=object, count=lengths.sum()))
+    terms = np.array([key_to_index.get(token, -1) for token in uniques], dtype=np.int64)[codes]
+    songs = np.repeat(np.arange(len(tokens)), lengths)
+    known = terms >= 0
+
+    # Converting to CSR sums repeated tokens, which are then reset to 1
+    matrix = sparse.csr_matrix(
+        (np.ones(known.sum(), dtype=np.float32), (songs[known], terms[known])),
+        shape=(len(tokens), len(key_to_index))
+    )
+    matrix.data[:] = 1
+    return matrix
+
+def vocabulary_similarities(model, words, chunk_size=65536):
+    """
+    Calculates the cosine similarity between every word of the vocabulary and every query word,
+    with one matrix multiplication per chunk of the vocabulary.
+
+    Parameters:
+        model (EmbeddingStore or Gensim model): The word embedding model.
+        words (list of str): The query words, all in the vocabulary.
+        chunk_size (int): Number of vocabulary vectors compared at a time, to bound memory.
+
+    Returns:
+        array: Vocabulary x query words similarities.
+    """
+    query_vectors = np.asarray(model.vectors[[model.key_to_index[word] for word in words]], dtype=np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    similarities = np.empty((len(model.vectors), len(words)), dtype=np.float32)
+    for start in range(0, len(model.vectors), chunk_size):
+        chunk = np.asarray(model.vectors[start:start + chunk_size], dtype=np.float32)
+        chunk = chunk / np.maximum(np.linalg.norm(chunk, axis=1, keepdims=True), 1e-12)
+        similarities[start:start + chunk_size] = chunk @ query_vectors.T
+    return similarities
+
+def relevance_scores(matrix, similarities):
+    """
+    Scores every song for every query word by the mean and the max cosine similarity of its distinct tokens to the word.
+    The mean is a sparse matrix product, and the max a segmented reduction over the non-zero entries of every song.
+
+    Parameters:
+        matrix (csr_matrix): Binary songs x vocabulary matrix.
+        similarities (array): Vocabulary x query words similarities.
+
+    Returns:
+        tuple: Songs x query words arrays of mean and max similarities, NaN for songs without known tokens.
+    """
+    n_terms = matrix.getnnz(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.asarray(matrix @ similarities) / n_terms[:, None]
+
+    max_scores = np.full((matrix.shape[0], similarities.shape[1]), np.nan, dtype=np.float32)
+    nonempty = n_terms > 0
+    if nonempty.any():
+        max_scores[nonempty] = np.maximum.reduceat(similarities[matrix.indices], matrix.indptr[:-1][nonempty], axis=0)
+    return mean, max_scores
+
+def score_songs(model, songs, words):
+    """
+    Scores the given songs for every query word.
+
+    Parameters:
+        model (EmbeddingStore or Gensim model): The word embedding model.
+        songs (DataFrame): The preprocessed songs, with 'artist', 'song', and 'text' columns.
+        words (list of str): The query words.
+
+    Returns:
+        DataFrame: One row per song and query word with the mean and max similarity of the song's tokens to the word.
+    """
+    known = [word for word in dict.fromkeys(words) if word in model.key_to_index]
+    mean, max_scores = None, None
+    if known:
+        matrix = song_term_matrix(songs['text'], model.key_to_index)
+        mean, max_scores = relevance_scores(matrix, vocabulary_similarities(model, known))
+
+    scores = []
+    for word in dict.fromkeys(words):
+        scored = mean is not None and word in known
+        scores.append(pd.DataFrame({
+            'artist': songs['artist'].to_numpy(),
+            'song': songs['song'].to_numpy(),
+            'word': word,
+            'mean_similarity': mean[:, known.index(word)] if scored else np.nan,
+            'max_similarity': max_scores[:, known.index(word)] if scored else np.nan,
+        }))
+    return pd.concat(scores, ignore_index=True)
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from lyrics_index import LyricsIndex, build_index
+
+
+def test_build_index_skips_songs_without_artist():
+    df = pd.DataFrame({
+        'artist': ['ABBA', None, 'abba'],
+        'text': ['love song', 'love story', 'dancing queen'],
+    })
+
+    index = LyricsIndex(build_index(df))
+
+    assert list(index.artist_songs('ABBA')) == [0, 2]
+    assert list(index.token_songs('love')) == [0, 1]
+    assert index.calc_perc('abba', ['love']) == 50
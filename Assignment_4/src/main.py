@@ -6,68 +6,225 @@
 
 # Importing packages
 import argparse
+import functools
+import io
+import json
 import os
+import time
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from transformers import pipeline
-from codecarbon import EmissionsTracker
+from prediction_cache import PredictionCache, normalise_text
+from sharded_inference import ShardedClassifier
+from quantized_backend import load_quantized_pipeline
+
+# Name of the pretrained emotion model, also the model id of the cached predictions
+MODEL_NAME = "j-hartmann/emotion-english-distilroberta-base"
+
+# Inference backends: the stock fp32 pipeline, and a dynamically int8-quantized copy of the model
+BACKENDS = ['pytorch', 'quantized']
 
 # Defining argument parsing
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Perform emotion analysis on Game of Thrones scripts.')
     parser.add_argument('--dataset_path', type=str, required=True, help='Path to the CSV dataset file')
     parser.add_argument('--output_dir', type=str, required=False, default='../out', help='Output directory for the resulting outputs, plots, and emission files')
+    parser.add_argument('--batch_size', type=int, default=32, help='Number of lines classified together')
+    parser.add_argument('--max_length', type=int, default=512, help='Max number of tokens per line, longer lines are truncated')
+    parser.add_argument('--cache_dir', type=str, default='../cache', help='Directory of the per-sentence prediction cache')
+    parser.add_argument('--no_cache', action='store_true', help='Classify all lines without reading or writing the prediction cache')
+    parser.add_argument('--n_jobs', type=int, default=1, help='Number of worker processes the lines are sharded across')
+    parser.add_argument('--torch_threads', type=int, default=None, help='Number of torch threads per worker process, defaults to the CPU cores divided by the workers')
+    parser.add_argument('--all_scores', action='store_true', help='Add the score of every emotion to the output, not only the predicted label')
+    parser.add_argument('--stream', action='store_true', help='Annotate the dataset chunk by chunk, appending to the output CSV, and resume interrupted runs')
+    parser.add_argument('--chunk_size', type=int, default=4096, help='Number of lines read, classified, and written at a time in streaming mode')
+    parser.add_argument('--backend', type=str, choices=BACKENDS, default='pytorch', help='Inference backend of the emotion model')
+    parser.add_argument('--export_dir', type=str, default='../models/quantized', help='Directory of the quantized model, exported on first use')
+    parser.add_argument('--compare_backends', action='store_true', help='Compare the agreement, throughput, and emissions of the backends on a sample of lines')
+    parser.add_argument('--compare_sample', type=int, default=500, help='Number of randomly drawn lines used to compare the backends')
     return parser.parse_args()
 
 ##### 
 # Defining Functions
 #####
 
-def load_data(dataset_path, output_dir):
+def load_data(dataset_path):
     """
-    Loads the dataset and previously predicted emotions if available; otherwise, performs emotion prediction.
+    Loads the dataset.
 
     Parameters:
         dataset_path (str): Path to the input CSV file.
-        output_dir (str): Directory to check for existing output data and save output files.
 
     Returns:
         pd.DataFrame: Loaded data.
     """
     print("Loading data...")    
-    emotion_predictions_output = os.path.join(output_dir, 'Emotion_Analysis_Output.csv')
-    if os.path.exists(emotion_predictions_output):
-        data = pd.read_csv(emotion_predictions_output)
-    else:
-        data = pd.read_csv(dataset_path)
-        data = predict_emotions(data)
-        save_predicted_emotions(data, output_dir)
+    data = pd.read_csv(dataset_path)
     
     print(f"Data loaded. Total lines: {len(data)}")
     return data
 
-def predict_emotions(data):
+def model_id(backend):
+    """
+    Returns the id of the emotion model run with a backend, under which its predictions are cached.
+
+    Parameters:
+        backend (str): Inference backend of the emotion model.
+
+    Returns:
+        str: The model name, followed by the backend unless it is the stock pipeline.
+    """
+    return MODEL_NAME if backend == 'pytorch' else f"{MODEL_NAME}:{backend}"
+
+@functools.lru_cache(maxsize=None)
+def load_classifier(backend='pytorch', export_dir='../models/quantized'):
+    """
+    Loads the pretrained emotion classification pipeline.
+    Transformers is only imported on the first call and the pipeline is cached for the rest of the process.
+
+    Parameters:
+        backend (str): Inference backend of the emotion model.
+        export_dir (str): Directory of the quantized model.
+
+    Returns:
+        transformers.Pipeline: Text classification pipeline.
+    """
+    if backend == 'quantized':
+        return load_quantized_pipeline(MODEL_NAME, export_dir)
+
+    from transformers import pipeline
+
+    return pipeline("text-classification", model=MODEL_NAME)
+
+def classify_lines(lines, batch_size=32, max_length=512, backend='pytorch', export_dir='../models/quantized'):
+    """
+    Classifies lines with the emotion pipeline in batches of similar length. The lines are sorted by length
+    before batching, so that each batch is padded to about the length of its own lines rather than of the
+    longest line overall, and the predictions are returned in the original order.
+
+    Parameters:
+        lines (list of str): The lines to classify.
+        batch_size (int): Number of lines classified together.
+        max_length (int): Max number of tokens per line, longer lines are truncated.
+        backend (str): Inference backend of the emotion model.
+        export_dir (str): Directory of the quantized model.
+
+    Returns:
+        list of dict: The predicted label and the scores of every emotion for each line.
+    """
+    classifier = load_classifier(backend, export_dir)
+    order = np.argsort([len(line) for line in lines], kind='stable')[::-1]
+
+    start_time = time.perf_counter()
+    sorted_predictions = classifier([lines[i] for i in order], batch_size=batch_size, truncation=True, max_length=max_length, top_k=None)
+    elapsed = time.perf_counter() - start_time
+    print(f"Classified {len(lines)} lines in {elapsed:.1f}s ({len(lines) / elapsed:.1f} sentences/sec)")
+
+    predictions = [None] * len(lines)
+    for i, prediction in zip(order, sorted_predictions):
+        # With top_k=None the scores of all emotions are returned, highest first
+        predictions[i] = {'label': prediction[0]['label'], 'scores': {entry['label']: entry['score'] for entry in prediction}}
+    return predictions
+
+def predict_emotions(data, batch_size=32, max_length=512, cache=None, sharded=None, all_scores=False, backend='pytorch', export_dir='../models/quantized'):
     """
     Analyses and predicts the emotion scores for all lines in the data with a pretrained language model.
+    Repeated lines are only classified once, and lines found in the prediction cache are not classified at all. Lines are
+    looked up by their normalised text, but the model is always given the line as it is in the data.
 
     Parameters:
         data (pd.DataFrame): Dataset with script data for emotion prediction.
+        batch_size (int): Number of lines classified together.
+        max_length (int): Max number of tokens per line, longer lines are truncated.
+        cache (PredictionCache, optional): Per-sentence cache of earlier predictions.
+        sharded (ShardedClassifier, optional): Worker processes to classify the lines in checkpointed shards with.
+        all_scores (bool): Whether to add a '<emotion>_score' column for every emotion.
+        backend (str): Inference backend of the emotion model.
+        export_dir (str): Directory of the quantized model.
 
     Returns:
         pd.DataFrame: DataFrame with included emotion labels.
     """
     print("Predicting emotions for each line. This can take a while...")
-    classifier = pipeline("text-classification",
-                          model="j-hartmann/emotion-english-distilroberta-base")
-    
     lines = [str(line) for line in data['Sentence'].tolist()]
-    emotion_scores = classifier(lines)
+    keys = [normalise_text(line) for line in lines]
+    # The first line of every cache key is the one sent to the model, unchanged
+    unique_lines = {}
+    for key, line in zip(keys, lines):
+        unique_lines.setdefault(key, line)
+
+    predictions = cache.get_many(list(unique_lines)) if cache is not None else {}
+    new_keys = [key for key in unique_lines if key not in predictions]
+    print(f"{len(unique_lines)} unique lines, {len(predictions)} found in the prediction cache, {len(new_keys)} to classify")
 
-    labels = [entry['label'] for entry in emotion_scores]
-    data['Emotion_Label'] = labels
+    if new_keys:
+        new_lines = [unique_lines[key] for key in new_keys]
+        if sharded is not None:
+            classified = sharded.classify(new_lines, batch_size, max_length)
+        else:
+            classified = classify_lines(new_lines, batch_size, max_length, backend, export_dir)
+        new_predictions = dict(zip(new_keys, classified))
+        if cache is not None:
+            cache.put_many(new_predictions)
+        predictions.update(new_predictions)
+
+    data['Emotion_Label'] = [predictions[key]['label'] for key in keys]
+    if all_scores and keys:
+        for emotion in sorted(predictions[keys[0]]['scores']):
+            data[f'{emotion}_score'] = [predictions[key]['scores'][emotion] for key in keys]
     print("Emotion prediction completed")
     return data
 
+def compare_backends(data, output_dir, sample_size=500, batch_size=32, max_length=512, export_dir='../models/quantized', tracker=None, seed=42):
+    """
+    Classifies a random sample of lines with every backend and compares them with the stock pipeline: the share of
+    lines given the same label, the throughput, and, if a tracker is given, the energy use and emissions. The comparison
+    is saved as a CSV file.
+
+    Parameters:
+        data (pd.DataFrame): Dataset with script data.
+        output_dir (str): Directory to save the CSV file.
+        sample_size (int): Number of randomly drawn lines.
+        batch_size (int): Number of lines classified together.
+        max_length (int): Max number of tokens per line, longer lines are truncated.
+        export_dir (str): Directory of the quantized model.
+        tracker (EmissionsTracker, optional): Running tracker, used to record a task per backend.
+        seed (int): Seed of the line sample.
+
+    Returns:
+        pd.DataFrame: One row per backend with its agreement, throughput, energy use, and emissions.
+    """
+    print("Comparing inference backends...")
+    sample = data['Sentence'].sample(min(sample_size, len(data)), random_state=seed)
+    lines = [str(line) for line in sample.tolist()]
+
+    results = []
+    baseline = None
+    for backend in BACKENDS:
+        # Loads the model outside the timed and tracked section
+        load_classifier(backend, export_dir)
+        if tracker is not None:
+            tracker.start_task(f"compare_{backend}")
+        start_time = time.perf_counter()
+        labels = [prediction['label'] for prediction in classify_lines(lines, batch_size, max_length, backend, export_dir)]
+        elapsed = time.perf_counter() - start_time
+        task_emissions = tracker.stop_task() if tracker is not None else None
+
+        baseline = baseline or labels
+        results.append({
+            'backend': backend,
+            'n_lines': len(lines),
+            'agreement': np.mean([label == base for label, base in zip(labels, baseline)]),
+            'seconds': elapsed,
+            'sentences_per_sec': len(lines) / elapsed,
+            'energy_kwh': task_emissions.energy_consumed if task_emissions is not None else np.nan,
+            'emissions_kg': task_emissions.emissions if task_emissions is not None else np.nan,
+        })
+
+    results = pd.DataFrame(results)
+    results.to_csv(os.path.join(output_dir, 'backend_comparison.csv'), index=False)
+    print(results.to_string(index=False))
+    return results
+
 def save_predicted_emotions(data, output_dir):
     """
     Saves the dataset with predicted emotions to a CSV file.
@@ -78,14 +235,134 @@ def save_predicted_emotions(data, output_dir):
     """
     data.to_csv(os.path.join(output_dir, 'Emotion_Analysis_Output.csv'), index=False)
 
-def plot_emotions_per_season(data, output_dir):
+def iter_csv_chunks(dataset_path, chunk_size, offset=0):
+    """
+    Reads a CSV file in chunks of whole records, starting at a byte offset, so a resumed run does not have to
+    parse the records before it. A record ends at a line break outside quotes, so quoted lines with line breaks
+    stay in one record.
+
+    Parameters:
+        dataset_path (str): Path to the CSV file.
+        chunk_size (int): Number of records per chunk.
+        offset (int): Byte offset of the first record to read, or 0 to start after the header.
+
+    Yields:
+        tuple: A chunk of the file as a DataFrame, and the byte offset right after the chunk.
+    """
+    with open(dataset_path, 'rb') as csv_file:
+        header = csv_file.readline()
+        if offset:
+            csv_file.seek(offset)
+        position = csv_file.tell()
+        records, record, quotes = [], b'', 0
+        for line in csv_file:
+            record += line
+            quotes += line.count(b'"')
+            if quotes % 2:
+                continue
+            records.append(record)
+            position += len(record)
+            record, quotes = b'', 0
+            if len(records) == chunk_size:
+                yield pd.read_csv(io.BytesIO(header + b''.join(records))), position
+                records = []
+        if record:
+            records.append(record)
+            position += len(record)
+        if records:
+            yield pd.read_csv(io.BytesIO(header + b''.join(records))), position
+
+def annotate_stream(dataset_path, output_dir, predict, chunk_size=4096, all_scores=False, model=MODEL_NAME):
+    """
+    Annotates the dataset chunk by chunk: every chunk is read, classified, and appended to the output CSV file,
+    so memory use does not grow with the size of the dataset. After every chunk, the number of annotated lines,
+    the byte offset reached in the dataset, and the byte offset of the output file are saved in a progress file.
+    A rerun on the same dataset with the same model truncates the output to the saved offset, dropping a partly
+    written chunk, and continues reading the dataset from its saved offset.
+
+    Parameters:
+        dataset_path (str): Path to the input CSV file.
+        output_dir (str): Directory to save the CSV and progress files.
+        predict (function): Adds the predicted emotions to a chunk, e.g. predict_emotions with its settings.
+        chunk_size (int): Number of lines read, classified, and written at a time.
+        all_scores (bool): Whether the chunks include the score of every emotion.
+        model (str): Id of the emotion model and backend, so a run is never resumed with another model.
+
+    Returns:
+        str: Path to the annotated CSV file.
+    """
+    output_path = os.path.join(output_dir, 'Emotion_Analysis_Output.csv')
+    progress_path = os.path.join(output_dir, 'Emotion_Analysis_Output.progress.json')
+    dataset_stat = os.stat(dataset_path)
+    source = {
+        'dataset_path': os.path.abspath(dataset_path),
+        'dataset_size': dataset_stat.st_size,
+        'dataset_mtime': dataset_stat.st_mtime,
+        'all_scores': all_scores,
+        'model': model,
+    }
+
+    progress = {'source': source, 'rows': 0, 'dataset_offset': 0, 'offset': 0}
+    if os.path.exists(progress_path) and os.path.exists(output_path):
+        with open(progress_path) as progress_file:
+            saved_progress = json.load(progress_file)
+        if saved_progress['source'] == source:
+            progress = saved_progress
+            print(f"Resuming after {progress['rows']} annotated lines")
+        else:
+            print("The dataset, model, or settings changed since the last run, annotating from the start")
+
+    with open(output_path, 'a' if progress['offset'] else 'w', newline='') as output_file:
+        output_file.truncate(progress['offset'])
+        for chunk, dataset_offset in iter_csv_chunks(dataset_path, chunk_size, progress['dataset_offset']):
+            # Chunks of blank lines have nothing to annotate, but are still skipped on a resume
+            if not chunk.empty:
+                chunk = predict(chunk)
+                chunk.to_csv(output_file, header=progress['offset'] == 0, index=False)
+                output_file.flush()
+
+            progress = {'source': source, 'rows': progress['rows'] + len(chunk), 'dataset_offset': dataset_offset, 'offset': output_file.tell()}
+            with open(progress_path + '.tmp', 'w') as progress_file:
+                json.dump(progress, progress_file)
+            os.replace(progress_path + '.tmp', progress_path)
+            print(f"{progress['rows']} lines annotated")
+    return output_path
+
+def aggregate_emotions(chunks, output_dir):
+    """
+    Counts the emotion labels of every season in a single grouped pass and saves the table as a CSV file.
+
+    Parameters:
+        chunks (iterable of pd.DataFrame): Dataset with included emotion labels, in one or more chunks.
+        output_dir (str): Directory to save the CSV file.
+
+    Returns:
+        pd.DataFrame: Season x emotion label counts, with the seasons in order of appearance and the labels sorted; empty if there are no lines.
+    """
+    print("Counting emotions per season...")
+    counts = None
+    seasons = {}
+    for chunk in chunks:
+        chunk_counts = pd.crosstab(chunk['Season'], chunk['Emotion_Label'])
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+        seasons.update(dict.fromkeys(chunk['Season'].unique()))
+    if counts is None:
+        # No lines were annotated, e.g. an empty dataset
+        counts = pd.DataFrame(index=pd.Index([], name='Season'), columns=pd.Index([], name='Emotion_Label'), dtype=int)
+    counts = counts.reindex(index=list(seasons), columns=sorted(counts.columns)).fillna(0).astype(int)
+    counts.to_csv(os.path.join(output_dir, 'emotion_counts_per_season.csv'))
+    return counts
+
+def plot_emotions_per_season(counts, output_dir):
     """
     Plots and saves the distribution of emotion labels for each season.
 
     Parameters:
-        data (pd.DataFrame): Dataset with included emotion labels.
+        counts (pd.DataFrame): Season x emotion label counts.
         output_dir (str): Directory to save the plot image.
     """
+    import matplotlib.pyplot as plt
+
     print("Plotting emotion distribution per season...")
     emotion_colours = {
         'anger': 'red',
@@ -97,14 +374,11 @@ def plot_emotions_per_season(data, output_dir):
         'neutral': 'grey'        
     }
 
-    seasons = data['Season'].unique()
-
     fig, axes = plt.subplots(2, 4, figsize=(20, 20))
     axes = axes.flatten()
     
-    for i, (season, ax) in enumerate(zip(seasons, axes)):
-        season_data = data[data['Season'] == season]
-        emotion_count = season_data['Emotion_Label'].value_counts()
+    for (season, emotion_count), ax in zip(counts.iterrows(), axes):
+        emotion_count = emotion_count[emotion_count > 0].sort_values(ascending=False, kind='stable')
         
         ax.bar(emotion_count.index, emotion_count.values, color=[emotion_colours.get(emotion, 'black') for emotion in emotion_count.index])
         ax.set_title(f'Distribution of the 7 Emotion Labels in {season}')
@@ -117,27 +391,27 @@ def plot_emotions_per_season(data, output_dir):
 
     print("Emotion distribution per season plotted")
 
-def plot_rel_freq_emotions(data, output_dir):
+def plot_rel_freq_emotions(counts, output_dir):
     """
     Plots and saves the relative frequency of each emotion label across all seasons.
 
     Parameters:
-        data (pd.DataFrame): Dataset with included emotion labels.
+        counts (pd.DataFrame): Season x emotion label counts.
         output_dir (str): Directory to save the plot image.
     """
+    import matplotlib.pyplot as plt
+
     print("Plotting relative frequency of emotions across seasons...")
     
-    seasons = data['Season'].unique()
-    emotion_labels = data['Emotion_Label'].unique()
-    sorted_emotion_labels = sorted(emotion_labels)
+    relative_freq = counts.div(counts.sum(axis=1), axis=0)
+    seasons = relative_freq.index
+    sorted_emotion_labels = list(relative_freq.columns)
     
     plt.figure(figsize=(10, 6))
     width = 0.8 / len(seasons)
 
     for i, season in enumerate(seasons):
-        season_data = data[data['Season'] == season]
-        relative_freq = season_data['Emotion_Label'].value_counts(normalize=True)
-        values = [relative_freq.get(label, 0) for label in sorted_emotion_labels]
+        values = relative_freq.loc[season].to_numpy()
         plt.bar([x + i * width for x in range(len(sorted_emotion_labels))], values, width=width, align='center', label=f'{season}', alpha=0.8)
     
     plt.title('Relative Frequency of Emotion Labels Across All Seasons')
@@ -156,6 +430,8 @@ def plot_rel_freq_emotions(data, output_dir):
 
 def main():
     args = parse_arguments()
+    from codecarbon import EmissionsTracker
+
     tracker = EmissionsTracker(
         project_name="emotion_analysis",
         experiment_id="emotion_analysis_got",
@@ -164,20 +440,58 @@ def main():
     )
     tracker.start()
 
-    tracker.start_task("load_data")
-    data = load_data(args.dataset_path, args.output_dir)
-    tracker.stop_task()
+    if args.compare_backends:
+        compare_backends(load_data(args.dataset_path), args.output_dir, args.compare_sample, args.batch_size, args.max_length, args.export_dir, tracker)
+
+    cache = None if args.no_cache else PredictionCache(os.path.join(args.cache_dir, 'predictions.sqlite'), model_id(args.backend))
+    sharded = None
+    if args.n_jobs > 1:
+        sharded = ShardedClassifier(
+            functools.partial(classify_lines, backend=args.backend, export_dir=args.export_dir),
+            functools.partial(load_classifier, args.backend, args.export_dir),
+            os.path.join(args.cache_dir, 'shards'), model_id(args.backend), args.n_jobs, args.torch_threads
+        )
+    predict = functools.partial(
+        predict_emotions, batch_size=args.batch_size, max_length=args.max_length, cache=cache, sharded=sharded,
+        all_scores=args.all_scores, backend=args.backend, export_dir=args.export_dir
+    )
 
-    tracker.start_task("predict_emotions")
-    data = predict_emotions(data)
+    if args.stream:
+        tracker.start_task("annotate_stream")
+        output_path = annotate_stream(args.dataset_path, args.output_dir, predict, args.chunk_size, args.all_scores, model_id(args.backend))
+        tracker.stop_task()
+        chunks = pd.read_csv(output_path, usecols=['Season', 'Emotion_Label'], chunksize=args.chunk_size)
+    else:
+        tracker.start_task("load_data")
+        data = load_data(args.dataset_path)
+        tracker.stop_task()
+
+        tracker.start_task("predict_emotions")
+        data = predict(data)
+        save_predicted_emotions(data, args.output_dir)
+        tracker.stop_task()
+        chunks = [data]
+
+    if sharded is not None:
+        sharded.close()
+    if cache is not None:
+        cache.close()
+
+    tracker.start_task("aggregate_emotions")
+    counts = aggregate_emotions(chunks, args.output_dir)
     tracker.stop_task()
 
+    if counts.empty:
+        tracker.stop()
+        print("No annotated lines to count, so no plots were made")
+        return
+
     tracker.start_task("plot_emotions_per_season")
-    plot_emotions_per_season(data, args.output_dir)
+    plot_emotions_per_season(counts, args.output_dir)
     tracker.stop_task()
 
     tracker.start_task("plot_relative_freq_emotions")
-    plot_rel_freq_emotions(data, args.output_dir)
+    plot_rel_freq_emotions(counts, args.output_dir)
     tracker.stop_task()
     
     tracker.stop()
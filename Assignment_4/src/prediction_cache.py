@@ -0,0 +1,77 @@
+######
+# Assignment 4 - Emotion Analysis with Pretrained Language Models
+# Persistent per-sentence cache of emotion predictions in SQLite
+######
+
+# Importing packages
+import os
+import json
+import sqlite3
+
+#####
+# Defining Functions
+#####
+
+def normalise_text(text):
+    """
+    Normalises a line for the cache key by collapsing all whitespace; the case is kept, as the model is case-sensitive.
+
+    Parameters:
+        text (str): The line.
+
+    Returns:
+        str: The normalised line.
+    """
+    return ' '.join(str(text).split())
+
+class PredictionCache:
+    """
+    Emotion predictions keyed by normalised sentence and model id, so every distinct sentence
+    is only classified once across runs, scripts, and edited versions of a script.
+    """
+
+    def __init__(self, cache_path, model_name):
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self.connection = sqlite3.connect(cache_path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "model TEXT NOT NULL, sentence TEXT NOT NULL, label TEXT NOT NULL, scores TEXT NOT NULL, "
+            "PRIMARY KEY (model, sentence))"
+        )
+        self.connection.commit()
+        self.model_name = model_name
+
+    def get_many(self, sentences):
+        """
+        Looks up the cached predictions of the given sentences.
+
+        Parameters:
+            sentences (list of str): Normalised sentences.
+
+        Returns:
+            dict: The label and the scores of every emotion for each cached sentence.
+        """
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS lookup (sentence TEXT PRIMARY KEY)")
+        self.connection.execute("DELETE FROM lookup")
+        self.connection.executemany("INSERT OR IGNORE INTO lookup VALUES (?)", ((sentence,) for sentence in sentences))
+        rows = self.connection.execute(
+            "SELECT p.sentence, p.label, p.scores FROM predictions p JOIN lookup l ON p.sentence = l.sentence WHERE p.model = ?",
+            (self.model_name,)
+        )
+        return {sentence: {'label': label, 'scores': json.loads(scores)} for sentence, label, scores in rows}
+
+    def put_many(self, predictions):
+        """
+        Stores predictions in the cache.
+
+        Parameters:
+            predictions (dict): The label and the scores of every emotion for each normalised sentence.
+        """
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)",
+            ((self.model_name, sentence, prediction['label'], json.dumps(prediction['scores'])) for sentence, prediction in predictions.items())
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,129 @@
+######
+# Assignment 4 - Emotion Analysis with Pretrained Language Models
+# Dynamically int8-quantized copy of the emotion model, exported once and loaded from disk
+######
+
+# Importing packages
+import os
+import json
+import shutil
+import tempfile
+
+# Version of the export layout, so exports in an older layout are made again
+EXPORT_FORMAT = 'state_dict'
+
+#####
+# Defining Functions
+#####
+
+def read_meta(export_dir):
+    """
+    Reads the metadata of a quantized export.
+
+    Parameters:
+        export_dir (str): Directory of the quantized model.
+
+    Returns:
+        dict: The model name, quantization, and versions of the export, or an empty dict if there is no export.
+    """
+    meta_path = os.path.join(export_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path) as meta_file:
+        return json.load(meta_file)
+
+def is_export_dir(export_dir):
+    """
+    Tells whether the script may (re)write an export directory: only if it is missing, empty, or already
+    holds an export of the quantized model.
+
+    Parameters:
+        export_dir (str): Directory of the quantized model.
+
+    Returns:
+        bool: Whether the directory is free for an export.
+    """
+    if not os.path.exists(export_dir):
+        return True
+    return os.path.isdir(export_dir) and (not os.listdir(export_dir) or 'quantization' in read_meta(export_dir))
+
+def quantize(model):
+    """
+    Quantizes the linear layers of a model to int8 with torch dynamic quantization.
+
+    Parameters:
+        model (torch.nn.Module): The emotion model.
+
+    Returns:
+        torch.nn.Module: The quantized model, in evaluation mode.
+    """
+    import torch
+
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def export_quantized(model_name, export_dir):
+    """
+    Quantizes the emotion model and exports the weights of the quantized model as a state dict, with the model
+    config and the tokenizer. Only tensors are saved, so loading the export runs no pickled code and does not
+    depend on the class layout of the installed transformers version. The export is assembled in a sibling
+    folder and renamed into place when it is complete.
+
+    Parameters:
+        model_name (str): Name of the pretrained emotion model.
+        export_dir (str): Directory of the quantized model.
+    """
+    if not is_export_dir(export_dir):
+        raise ValueError(f"'{export_dir}' is not an export of the quantized model, refusing to overwrite it")
+
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    print("Quantizing the emotion model. This is only done once...")
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    quantized = quantize(model)
+
+    parent_dir = os.path.dirname(os.path.abspath(export_dir))
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+    torch.save(quantized.state_dict(), os.path.join(tmp_dir, 'model.pt'))
+    model.config.save_pretrained(tmp_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(tmp_dir)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as meta_file:
+        json.dump({'model': model_name, 'quantization': 'dynamic int8', 'format': EXPORT_FORMAT, 'torch': torch.__version__}, meta_file)
+
+    # Quantizing takes a while, in which the user may have put other files in the directory
+    if not is_export_dir(export_dir):
+        shutil.rmtree(tmp_dir)
+        raise ValueError(f"'{export_dir}' is not an export of the quantized model, refusing to overwrite it")
+    shutil.rmtree(export_dir, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, export_dir)
+    except OSError:
+        # Another run exported the model in the meantime
+        shutil.rmtree(tmp_dir)
+
+def load_quantized_pipeline(model_name, export_dir):
+    """
+    Loads the quantized emotion model as a text classification pipeline, exporting it first if the export
+    directory holds no quantized copy of this model made with the installed torch version. The model is built
+    from its config, quantized the same way as for the export, and then given the exported weights.
+
+    Parameters:
+        model_name (str): Name of the pretrained emotion model.
+        export_dir (str): Directory of the quantized model.
+
+    Returns:
+        transformers.Pipeline: Text classification pipeline on the quantized model.
+    """
+    import torch
+    from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer, pipeline
+
+    meta = read_meta(export_dir)
+    if meta.get('model') != model_name or meta.get('format') != EXPORT_FORMAT or meta.get('torch') != torch.__version__:
+        export_quantized(model_name, export_dir)
+
+    model = quantize(AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(export_dir)))
+    model.load_state_dict(torch.load(os.path.join(export_dir, 'model.pt'), weights_only=True))
+    tokenizer = AutoTokenizer.from_pretrained(export_dir)
+    return pipeline("text-classification", model=model, tokenizer=tokenizer)
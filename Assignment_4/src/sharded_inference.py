@@ -0,0 +1,174 @@
+######
+# Assignment 4 - Emotion Analysis with Pretrained Language Models
+# Sharded emotion classification over several worker processes, with resumable checkpoints
+######
+
+# Importing packages
+import os
+import json
+import shutil
+import hashlib
+import multiprocessing
+
+#####
+# Defining Functions
+#####
+
+def shard_key(lines, model_name):
+    """
+    Calculates the key of a set of lines, so that an interrupted run on the same lines finds its checkpoints again.
+
+    Parameters:
+        lines (list of str): The lines to classify.
+        model_name (str): Name of the emotion model.
+
+    Returns:
+        str: Hexadecimal key of the lines and the model.
+    """
+    sha = hashlib.sha256(model_name.encode())
+    for line in lines:
+        sha.update(line.encode())
+        sha.update(b'\n')
+    return sha.hexdigest()[:16]
+
+def read_checkpoint(checkpoint_path):
+    """
+    Reads the predictions a shard has written so far. An incomplete last record, left by a run that was killed while writing, is skipped.
+
+    Parameters:
+        checkpoint_path (str): Path to the JSON lines checkpoint of the shard.
+
+    Returns:
+        dict: The label and the scores of every emotion for each classified line.
+    """
+    predictions = {}
+    if not os.path.exists(checkpoint_path):
+        return predictions
+    with open(checkpoint_path) as checkpoint_file:
+        for record in checkpoint_file:
+            try:
+                record = json.loads(record)
+            except json.JSONDecodeError:
+                continue
+            predictions[record['sentence']] = {'label': record['label'], 'scores': record['scores']}
+    return predictions
+
+# Classification function of a worker process, set by init_worker
+worker_classify = None
+
+def init_worker(classify, load, torch_threads):
+    """
+    Prepares a worker process once, when the pool starts: sets its number of torch threads and loads its copy of the model.
+
+    Parameters:
+        classify (function): Classifies a list of lines given the batch size and max length, e.g. classify_lines.
+        load (function): Loads the model, e.g. load_classifier with its backend.
+        torch_threads (int): Number of torch threads of the worker.
+    """
+    global worker_classify
+    import torch
+    torch.set_num_threads(torch_threads)
+    load()
+    worker_classify = classify
+
+def run_shard(shard):
+    """
+    Classifies the lines of one shard in a worker process. The predictions are appended to the shard's checkpoint
+    after every chunk of lines, and lines already in the checkpoint are skipped.
+
+    Parameters:
+        shard (dict): The lines, checkpoint path, and settings of the shard.
+
+    Returns:
+        str: Path to the checkpoint of the shard.
+    """
+    checkpoint_path = shard['checkpoint_path']
+    done = read_checkpoint(checkpoint_path)
+    remaining = [line for line in shard['lines'] if line not in done]
+
+    with open(checkpoint_path, 'a') as checkpoint_file:
+        # Starts on a new line if the last record was cut off
+        if checkpoint_file.tell() > 0:
+            with open(checkpoint_path, 'rb') as existing:
+                existing.seek(-1, os.SEEK_END)
+                if existing.read(1) != b'\n':
+                    checkpoint_file.write('\n')
+
+        for start in range(0, len(remaining), shard['checkpoint_size']):
+            chunk = remaining[start:start + shard['checkpoint_size']]
+            predictions = worker_classify(chunk, shard['batch_size'], shard['max_length'])
+            for line, prediction in zip(chunk, predictions):
+                checkpoint_file.write(json.dumps({'sentence': line, **prediction}) + '\n')
+            checkpoint_file.flush()
+            print(f"Shard {shard['shard_id']}: {len(done) + start + len(chunk)}/{len(shard['lines'])} lines classified")
+    return checkpoint_path
+
+class ShardedClassifier:
+    """
+    A pool of worker processes, each with its own copy of the model, that classifies lines in checkpointed shards.
+    The pool is started on the first call and reused for every later one, e.g. for every chunk in streaming mode,
+    so the workers only load the model once per run, and not at all if every line is found in the cache.
+    """
+
+    def __init__(self, classify, load, shard_dir, model_name, n_jobs, torch_threads=None):
+        self.classify_lines = classify
+        self.load = load
+        self.shard_dir = shard_dir
+        self.model_name = model_name
+        self.n_jobs = n_jobs
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // n_jobs)
+        self.pool = None
+
+    def start(self):
+        """
+        Starts the worker processes, which load the model before taking any shards.
+        """
+        print(f"Starting {self.n_jobs} worker processes with {self.torch_threads} torch threads each...")
+        # Spawned workers start without a copy of the parent's torch thread pools
+        self.pool = multiprocessing.get_context('spawn').Pool(
+            self.n_jobs, initializer=init_worker, initargs=(self.classify_lines, self.load, self.torch_threads)
+        )
+
+    def classify(self, lines, batch_size=32, max_length=512, checkpoint_size=1024):
+        """
+        Splits the lines into one shard per worker process and classifies the shards in parallel. The lines are dealt out
+        in order of length, so every shard gets a similar amount of work. The shards are checkpointed under a key of the lines,
+        so rerunning after an interruption only classifies the lines that were not checkpointed yet.
+
+        Parameters:
+            lines (list of str): The distinct lines to classify.
+            batch_size (int): Number of lines classified together.
+            max_length (int): Max number of tokens per line, longer lines are truncated.
+            checkpoint_size (int): Number of lines classified between checkpoints.
+
+        Returns:
+            list of dict: The predicted label and the scores of every emotion for each line, in the order of the lines.
+        """
+        run_dir = os.path.join(self.shard_dir, shard_key(lines, self.model_name))
+        os.makedirs(run_dir, exist_ok=True)
+
+        by_length = sorted(lines, key=len, reverse=True)
+        shards = [{
+            'shard_id': i,
+            'lines': by_length[i::self.n_jobs],
+            'checkpoint_path': os.path.join(run_dir, f'shard_{i}.jsonl'),
+            'batch_size': batch_size,
+            'max_length': max_length,
+            'checkpoint_size': checkpoint_size,
+        } for i in range(self.n_jobs)]
+
+        if self.pool is None:
+            self.start()
+        print(f"Classifying {len(lines)} lines in {self.n_jobs} processes...")
+        checkpoint_paths = self.pool.map(run_shard, shards)
+
+        predictions = {}
+        for checkpoint_path in checkpoint_paths:
+            predictions.update(read_checkpoint(checkpoint_path))
+        shutil.rmtree(run_dir, ignore_errors=True)
+        return [predictions[line] for line in lines]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
@@ -0,0 +1,367 @@
+######
+# Assignment 5 - Evaluating Environmental Impact of Your Exam Portfolio
+# Streaming ingestion of CodeCarbon emission files into a columnar Parquet store
+######
+
+# Importing packages
+import os
+import io
+import re
+import csv
+import json
+import zlib
+import zipfile
+import contextlib
+import hashlib
+import tempfile
+import pandas as pd
+
+# Columns kept from the emission files and their types; columns a file lacks are added as missing values
+COLUMNS = {
+    'task_name': 'string',
+    'timestamp': 'string',
+    'project_name': 'string',
+    'run_id': 'string',
+    'duration': 'float64',
+    'emissions': 'float64',
+    'cpu_energy': 'float64',
+    'gpu_energy': 'float64',
+    'ram_energy': 'float64',
+    'energy_consumed': 'float64',
+    'codecarbon_version': 'string',
+}
+
+# Columns added during ingestion
+SOURCE_COLUMNS = {
+    'assignment': 'string',
+    'file': 'string',
+}
+
+# Columns every CodeCarbon emission file has; CSV files without them, e.g. model outputs, are not ingested
+EMISSION_COLUMNS = {'project_name', 'run_id', 'emissions'}
+
+# Emission files collected for this assignment are named after their assignment, e.g. 'A2_logreg_emission.csv'
+COLLECTED_FILE_PATTERN = re.compile(r'^(A\d+(?:_\w+?)?)_emission\.csv$')
+# Emission files written by CodeCarbon in an assignment's own folder, e.g. 'Assignment_2/out/emissions_logreg.csv'
+ASSIGNMENT_DIR_PATTERN = re.compile(r'^Assignment_(\d+)$')
+# CodeCarbon names total files after the script, e.g. 'emissions_logreg.csv', and task files after the id of their run
+TOTAL_FILE_PATTERN = re.compile(r'^emissions_(\w+)\.csv$')
+RUN_FILE_PATTERN = re.compile(r'emissions_base_([0-9a-f-]{36})\.csv$')
+
+#####
+# Defining Functions
+#####
+
+def assignment_name(file_path, run_assignments=None):
+    """
+    Derives the assignment name of an emission file from its location. A collected emission file is named after
+    its assignment. Otherwise the assignment is the 'Assignment_<n>' folder the file is in, followed by the script
+    name CodeCarbon gave a total file, e.g. 'emissions_logreg.csv'. A task file, named after the id of its run,
+    takes the assignment of the total file of that run.
+
+    Parameters:
+        file_path (str): Path to the emission file, e.g. 'in/A2_logreg_emission.csv' or 'Assignment_2/out/emissions_logreg.csv'.
+        run_assignments (dict, optional): Assignment of the total file of every run id, as returned by find_run_assignments.
+
+    Returns:
+        str or None: The assignment name, e.g. 'A2_logreg', or None if the location does not tell,
+        in which case the project name of the rows is used.
+    """
+    file_name = os.path.basename(file_path)
+    collected = COLLECTED_FILE_PATTERN.match(file_name)
+    if collected is not None:
+        return collected.group(1)
+
+    run_file = RUN_FILE_PATTERN.search(file_name)
+    if run_file is not None and run_assignments and run_file.group(1) in run_assignments:
+        return run_assignments[run_file.group(1)]
+
+    folders = os.path.dirname(os.path.abspath(file_path.replace('::', os.sep))).split(os.sep)
+    for folder in reversed(folders):
+        assignment_dir = ASSIGNMENT_DIR_PATTERN.match(folder)
+        if assignment_dir is not None:
+            total_file = TOTAL_FILE_PATTERN.match(file_name) if run_file is None else None
+            return f'A{assignment_dir.group(1)}' + (f'_{total_file.group(1)}' if total_file else '')
+    return None
+
+def find_run_assignments(sources):
+    """
+    Reads the run ids of the total files named after their script, so that the task files of those runs can be
+    given the same assignment. Total files hold one row per run, so this only reads a few small files.
+
+    Parameters:
+        sources (list of dict): The CSV files, as listed by find_sources.
+
+    Returns:
+        dict: The assignment of every run id with a total file.
+    """
+    run_assignments = {}
+    for source in sources:
+        file_name = os.path.basename(source['name'])
+        if RUN_FILE_PATTERN.search(file_name) or not TOTAL_FILE_PATTERN.match(file_name):
+            continue
+        assignment = assignment_name(source['key'])
+        if assignment is None or not is_emission_file(source):
+            continue
+        with open_source(source) as csv_file:
+            for run_id in pd.read_csv(csv_file, usecols=['run_id'], dtype=str)['run_id'].dropna():
+                run_assignments[run_id] = assignment
+    return run_assignments
+
+def find_sources(dataset_path):
+    """
+    Lists the emission files in a directory (searched recursively), a zip archive, or zip archives within a directory,
+    without extracting anything.
+
+    Parameters:
+        dataset_path (str): Path to a directory, a zip archive, or a single CSV file.
+
+    Returns:
+        list of dict: The key, name, location, and fingerprint (zip members) or size and modification time (files) of every CSV file, sorted by name.
+    """
+    def archive_sources(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            return [{
+                'key': f'{os.path.abspath(archive_path)}::{member.filename}',
+                'name': member.filename,
+                'fingerprint': [member.file_size, member.CRC],
+                'archive': archive_path,
+                'member': member.filename,
+            } for member in archive.infolist() if member.filename.endswith('.csv') and not member.is_dir()]
+
+    def file_source(file_path):
+        # The fingerprint is only calculated by ingest, for files whose size or modification time changed
+        file_stat = os.stat(file_path)
+        return {
+            'key': os.path.abspath(file_path),
+            'name': os.path.relpath(file_path, dataset_path) if os.path.isdir(dataset_path) else os.path.basename(file_path),
+            'stat': [file_stat.st_size, file_stat.st_mtime_ns],
+            'path': file_path,
+        }
+
+    if zipfile.is_zipfile(dataset_path):
+        sources = archive_sources(dataset_path)
+    elif os.path.isfile(dataset_path):
+        sources = [file_source(dataset_path)]
+    else:
+        sources = []
+        for root, _, files in os.walk(dataset_path):
+            for file in sorted(files):
+                file_path = os.path.join(root, file)
+                if file.endswith('.csv'):
+                    sources.append(file_source(file_path))
+                elif file.endswith('.zip'):
+                    sources.extend(archive_sources(file_path))
+    return sorted(sources, key=lambda source: os.path.basename(source['name']))
+
+def file_fingerprint(file_path):
+    """
+    Calculates the fingerprint of a file, the same as that of a zip member: the size and CRC-32 of its content.
+
+    Parameters:
+        file_path (str): Path to the file.
+
+    Returns:
+        list: The size and CRC-32 of the file.
+    """
+    crc = 0
+    size = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+    return [size, crc]
+
+def save_manifest(manifest, manifest_path):
+    """
+    Saves the manifest of the store, replacing the previous one in a single step.
+
+    Parameters:
+        manifest (dict): The manifest of the store.
+        manifest_path (str): Path to the manifest file.
+    """
+    with open(manifest_path + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+def is_emission_file(source):
+    """
+    Checks from its header whether a CSV file was written by CodeCarbon, so that other CSV files in the searched
+    folders, such as the outputs of the assignments, are left out.
+
+    Parameters:
+        source (dict): The CSV file, as listed by find_sources.
+
+    Returns:
+        bool: Whether the file has the columns of an emission file.
+    """
+    try:
+        with open_source(source) as csv_file:
+            header = next(csv.reader(csv_file), [])
+    except (UnicodeDecodeError, csv.Error):
+        return False
+    return EMISSION_COLUMNS.issubset(header)
+
+@contextlib.contextmanager
+def open_source(source):
+    """
+    Opens an emission file for reading, streaming it straight out of its zip archive if it is in one.
+
+    Parameters:
+        source (dict): The emission file, as listed by find_sources.
+
+    Yields:
+        file object: The opened file in text mode.
+    """
+    if 'archive' in source:
+        with zipfile.ZipFile(source['archive']) as archive, archive.open(source['member']) as member:
+            yield io.TextIOWrapper(member, encoding='utf-8')
+    else:
+        with open(source['path'], encoding='utf-8') as csv_file:
+            yield csv_file
+
+def read_source(source, chunk_size=100000):
+    """
+    Reads an emission file in chunks, keeping only the needed columns with fixed types. Columns are matched by name,
+    extra columns are dropped and missing ones are added as missing values, so that task and total files and files
+    written by different CodeCarbon versions end up with the same schema.
+
+    Parameters:
+        source (dict): The emission file, as listed by find_sources.
+        chunk_size (int): Number of rows read at a time.
+
+    Yields:
+        pd.DataFrame: Chunks of the file with the columns of COLUMNS and SOURCE_COLUMNS.
+    """
+    with open_source(source) as csv_file:
+        chunks = pd.read_csv(csv_file, usecols=lambda column: column in COLUMNS, dtype=str, chunksize=chunk_size)
+        for chunk in chunks:
+            chunk = chunk.reindex(columns=list(COLUMNS))
+            chunk = chunk.astype({column: 'string' for column, dtype in COLUMNS.items() if dtype == 'string'})
+            for column, dtype in COLUMNS.items():
+                if dtype == 'float64':
+                    chunk[column] = pd.to_numeric(chunk[column], errors='coerce').astype('float64')
+            assignment = source.get('assignment', assignment_name(source['key']))
+            if assignment is None:
+                chunk['assignment'] = chunk['project_name'].fillna(os.path.splitext(os.path.basename(source['name']))[0])
+            else:
+                chunk['assignment'] = pd.Series(assignment, index=chunk.index, dtype='string')
+            chunk['file'] = pd.Series(os.path.basename(source['name']), index=chunk.index, dtype='string')
+            yield chunk
+
+def parquet_schema():
+    """
+    Returns the Parquet schema of the store.
+
+    Returns:
+        pyarrow.Schema: The columns of COLUMNS and SOURCE_COLUMNS with their types.
+    """
+    import pyarrow as pa
+
+    types = {'string': pa.string(), 'float64': pa.float64()}
+    return pa.schema([(column, types[dtype]) for column, dtype in {**COLUMNS, **SOURCE_COLUMNS}.items()])
+
+def ingest(dataset_path, store_dir, chunk_size=100000):
+    """
+    Appends the emission files that are new or changed since the last ingestion to the columnar store.
+    Every file becomes one Parquet part, written chunk by chunk, and the manifest records which files
+    the store holds with their fingerprints, so unchanged files are never parsed again. Files whose size and
+    modification time are unchanged are not read at all. CSV files that are not CodeCarbon emission files are
+    skipped after reading their header, and so is a file with the same name and content as an ingested one,
+    e.g. an unzipped copy next to its archive.
+
+    Parameters:
+        dataset_path (str): Path to a directory, a zip archive, or a single CSV file.
+        store_dir (str): Directory of the Parquet store.
+        chunk_size (int): Number of rows read and written at a time.
+
+    Returns:
+        dict: The manifest of the store.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(store_dir, exist_ok=True)
+    manifest_path = os.path.join(store_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+
+    schema = parquet_schema()
+    ingested = {(os.path.basename(entry['name']), tuple(entry['fingerprint'])) for entry in manifest.values()}
+    manifest_changed = False
+    sources = find_sources(dataset_path)
+    run_assignments = None
+    for source in sources:
+        entry = manifest.get(source['key'])
+        if entry is not None and ('stat' in source and entry.get('stat') == source['stat'] or entry['fingerprint'] == source.get('fingerprint')):
+            continue
+        if not is_emission_file(source):
+            continue
+        if 'stat' in source:
+            source['fingerprint'] = file_fingerprint(source['path'])
+        if entry is not None and entry['fingerprint'] == source['fingerprint']:
+            if 'stat' in source:
+                # Touched but unchanged, so only the size and modification time are updated
+                entry['stat'] = source['stat']
+                manifest_changed = True
+            continue
+        if (os.path.basename(source['name']), tuple(source['fingerprint'])) in ingested:
+            continue
+
+        # Only looked up once a task file needs it, as the total files have to be read for it
+        if run_assignments is None and RUN_FILE_PATTERN.search(source['name']):
+            run_assignments = find_run_assignments(sources)
+        source['assignment'] = assignment_name(source['key'], run_assignments)
+
+        part = hashlib.sha256(source['key'].encode()).hexdigest()[:16] + '.parquet'
+        rows = 0
+        fd, tmp_path = tempfile.mkstemp(dir=store_dir, suffix='.tmp')
+        os.close(fd)
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for chunk in read_source(source, chunk_size):
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                rows += len(chunk)
+        os.replace(tmp_path, os.path.join(store_dir, part))
+
+        if entry is not None:
+            ingested.discard((os.path.basename(entry['name']), tuple(entry['fingerprint'])))
+        ingested.add((os.path.basename(source['name']), tuple(source['fingerprint'])))
+        manifest[source['key']] = {
+            'name': source['name'],
+            'fingerprint': source['fingerprint'],
+            'assignment': source['assignment'],
+            'part': part,
+            'rows': rows,
+        }
+        if 'stat' in source:
+            manifest[source['key']]['stat'] = source['stat']
+        print(f"Ingested {source['name']} ({rows} rows)")
+
+        # Saved after every file, so an interrupted ingestion keeps the files it finished
+        save_manifest(manifest, manifest_path)
+
+    if manifest_changed:
+        save_manifest(manifest, manifest_path)
+    return manifest
+
+def load_store(store_dir, columns=None):
+    """
+    Reads the columnar store.
+
+    Parameters:
+        store_dir (str): Directory of the Parquet store.
+        columns (list of str, optional): Columns to read, defaults to all.
+
+    Returns:
+        pd.DataFrame: The rows of all ingested emission files.
+    """
+    import pyarrow.parquet as pq
+
+    with open(os.path.join(store_dir, 'manifest.json')) as manifest_file:
+        manifest = json.load(manifest_file)
+    parts = [os.path.join(store_dir, entry['part']) for entry in sorted(manifest.values(), key=lambda entry: os.path.basename(entry['name']))]
+    if not parts:
+        return parquet_schema().empty_table().to_pandas()
+    return pq.ParquetDataset(parts, schema=parquet_schema()).read(columns=columns).to_pandas()
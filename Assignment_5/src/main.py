@@ -6,85 +6,80 @@
 
 # Importing packages
 import argparse
-import pandas as pd
-import matplotlib.pyplot as plt
-import sys
 import os
+from ingest import ingest
+from warehouse import EmissionsWarehouse
 
 # Defining argument parsing
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Evaluate environmental impact of previous assignments.')
-    parser.add_argument('--dataset_path', type=str, default='../in', help='Path to the CSV emission files')
+    parser.add_argument('--dataset_path', type=str, default='../in', help='Path to the CSV emission files: a directory, a zip archive, or a directory of zip archives')
     parser.add_argument('--output_dir', type=str, default='../out', help='Output directory for the plots')
+    parser.add_argument('--store_dir', type=str, default='../store', help='Directory of the columnar store the emission files are ingested into')
     return parser.parse_args()
 
 ##### 
 # Defining Functions
 #####
 
-def load_data(dataset_path):
+def load_data(dataset_path, store_dir):
     """
-    Loads emissions data from CSV files in the specified directory.
+    Ingests new emission files into the columnar store and adds their new runs to the warehouse.
 
     Parameters:
-        dataset_path (str): Path to the directory containing the CSV files.
+        dataset_path (str): Path to the directory or zip archive containing the CSV files.
+        store_dir (str): Directory of the columnar store and the warehouse.
 
     Returns:
-        dict: Dictionary containing concatenated data for each assignment.
+        EmissionsWarehouse: Warehouse with the emission rollups of all ingested runs.
     """
-    assignments = {}
-    files = sorted(os.listdir(dataset_path))
-    
-    for file in files:
-        if file.endswith(".csv"):
-            assignment_name = file.replace('_emission.csv', '') 
-            if assignment_name not in assignments:
-                assignments[assignment_name] = []
-            df = pd.read_csv(os.path.join(dataset_path, file))
-            print(f"Loaded {file} with columns: {df.columns.tolist()}") 
-            df['file'] = file  
-            assignments[assignment_name].append(df)
-    
-    for key in assignments:
-        assignments[key] = pd.concat(assignments[key], ignore_index=True)
-    return assignments
-
-def calculate_total_emissions(assignments):
+    manifest = ingest(dataset_path, store_dir)
+    print(f"Store holds {len(manifest)} emission files with {sum(entry['rows'] for entry in manifest.values())} rows")
+
+    warehouse = EmissionsWarehouse(os.path.join(store_dir, 'warehouse.sqlite'))
+    n_runs = warehouse.update(store_dir, manifest)
+    print(f"Added {n_runs} new runs to the warehouse")
+    try:
+        warehouse.check_totals()
+    except ValueError as error:
+        raise SystemExit(str(error))
+    return warehouse
+
+def calculate_total_emissions(warehouse):
     """
     Calculates total emissions for each assignment.
 
     Parameters:
-        assignments (dict): Dictionary containing emissions data for each assignment.
+        warehouse (EmissionsWarehouse): Warehouse with the emission rollups.
 
     Returns:
         dict: Total emissions for each assignment.
     """
-    total_emissions = {}
-    for assignment, df in assignments.items():
-        total_emissions[assignment] = df['emissions'].sum()
-    return total_emissions
+    rollup = warehouse.rollup('assignment')
+    return dict(zip(rollup['assignment'], rollup['emissions']))
 
-def calculate_task_emissions(assignments):
+def calculate_task_emissions(warehouse):
     """
     Calculates emissions for each task in each assignment.
 
     Parameters:
-        assignments (dict): Dictionary containing emissions data for each assignment.
+        warehouse (EmissionsWarehouse): Warehouse with the emission rollups.
 
     Returns:
         pd.DataFrame: Emissions data for each task and assignment.
     """
-    task_emissions_list = []
-    for assignment, df in assignments.items():
-        if 'task_name' in df.columns:
-            task_emissions = df.groupby('task_name')['emissions'].sum().reset_index()
-            task_emissions['assignment'] = assignment 
-            task_emissions_list.append(task_emissions)
-    
-    if task_emissions_list:
-        return pd.concat(task_emissions_list, ignore_index=True)
-    else:
-        return pd.DataFrame(columns=['task_name', 'emissions', 'assignment'])
+    return warehouse.rollup('task')[['task_name', 'emissions', 'assignment']]
+
+def save_rollups(warehouse, output_dir):
+    """
+    Saves the emissions, energy use, and duration per run and per day as CSV files.
+
+    Parameters:
+        warehouse (EmissionsWarehouse): Warehouse with the emission rollups.
+        output_dir (str): Directory to save the CSV files.
+    """
+    warehouse.rollup('run').to_csv(os.path.join(output_dir, 'emissions_by_run.csv'), index=False)
+    warehouse.rollup('day').to_csv(os.path.join(output_dir, 'emissions_by_day.csv'), index=False)
 
 def plot_assignment_emissions(total_emissions, output_dir):
     """
@@ -94,6 +89,8 @@ def plot_assignment_emissions(total_emissions, output_dir):
         total_emissions (dict): Total emissions for each assignment.
         output_dir (str): Directory to save the plot image.
     """
+    import matplotlib.pyplot as plt
+
     assignments = list(total_emissions.keys())
     emissions = list(total_emissions.values())
 
@@ -130,6 +127,8 @@ def plot_task_emissions(task_emissions, output_dir):
         task_emissions (pd.DataFrame): Emissions data for each task and assignment.
         output_dir (str): Directory to save the plot images.
     """
+    import matplotlib.pyplot as plt
+
     assignment_colours = {
         'A2_logreg': 'seagreen',
         'A2_neural': 'limegreen',
@@ -192,10 +191,12 @@ def main():
 
     os.makedirs(args.output_dir, exist_ok=True)
     
-    data = load_data(args.dataset_path)
+    warehouse = load_data(args.dataset_path, args.store_dir)
 
-    total_emissions = calculate_total_emissions(data)
-    task_emissions = calculate_task_emissions(data)
+    total_emissions = calculate_total_emissions(warehouse)
+    task_emissions = calculate_task_emissions(warehouse)
+    save_rollups(warehouse, args.output_dir)
+    warehouse.close()
     
     plot_assignment_emissions(total_emissions, args.output_dir)
     plot_task_emissions(task_emissions, args.output_dir)
@@ -0,0 +1,183 @@
+######
+# Assignment 5 - Evaluating Environmental Impact of Your Exam Portfolio
+# Incremental SQLite warehouse of emission rollups per assignment, task, run, and day
+######
+
+# Importing packages
+import os
+import math
+import sqlite3
+import pandas as pd
+from ingest import RUN_FILE_PATTERN
+
+# Key columns of every rollup table; each table also holds the summed MEASURES and the number of rows
+ROLLUPS = {
+    'assignment': ['assignment'],
+    'task': ['assignment', 'task_name'],
+    'run': ['assignment', 'run_id', 'kind'],
+    'day': ['day', 'assignment'],
+}
+MEASURES = ['emissions', 'energy_consumed', 'duration']
+
+# Rollups that count every run once: from its task rows if it has any, and from its total row otherwise, as the
+# total row of a run with tasks covers the same emissions again
+RUN_ONCE_ROLLUPS = ['assignment', 'day']
+
+#####
+# Defining Functions
+#####
+
+def prepare_rows(data):
+    """
+    Adds the columns the rollups are grouped by: the kind of every row ('task' for task rows, 'total' for rows
+    of a whole run), the day of its timestamp, and a run id, taken from the file name where a row has none.
+
+    Parameters:
+        data (pd.DataFrame): Emission rows from the columnar store.
+
+    Returns:
+        pd.DataFrame: The rows with 'kind' and 'day' columns.
+    """
+    data = data.copy()
+    data['kind'] = data['task_name'].notna().map({True: 'task', False: 'total'})
+    data['day'] = data['timestamp'].str.slice(0, 10)
+    data['run_id'] = data['run_id'].fillna(data['file'])
+    return data
+
+class EmissionsWarehouse:
+    """
+    Emission sums per assignment, task, run, and day, kept up to date incrementally: every run is added to the
+    rollups once, identified by its run id, so reports are queries instead of scans over all emission files.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        statements = [
+            "CREATE TABLE IF NOT EXISTS loaded_files (part TEXT PRIMARY KEY, fingerprint TEXT NOT NULL)",
+            "CREATE TABLE IF NOT EXISTS loaded_runs (run_id TEXT NOT NULL, kind TEXT NOT NULL, file TEXT NOT NULL, PRIMARY KEY (run_id, kind))",
+        ]
+        for level, keys in ROLLUPS.items():
+            columns = ', '.join([f'{key} TEXT NOT NULL' for key in keys] + [f'{measure} REAL NOT NULL' for measure in MEASURES] + ['n_rows INTEGER NOT NULL'])
+            statements.append(f"CREATE TABLE IF NOT EXISTS rollup_{level} ({columns}, PRIMARY KEY ({', '.join(keys)}))")
+        for statement in statements:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def loaded_runs(self):
+        """
+        Returns the runs that are already in the rollups.
+
+        Returns:
+            set of tuple: The (run id, kind) of every loaded run.
+        """
+        return set(self.connection.execute("SELECT run_id, kind FROM loaded_runs"))
+
+    def add_rows(self, data, levels=None, sign=1):
+        """
+        Adds emission rows to rollup tables by summing them per key and adding the sums to the stored ones.
+
+        Parameters:
+            data (pd.DataFrame): Prepared emission rows of runs that are not loaded yet.
+            levels (list of str, optional): Rollups to add the rows to, defaults to all.
+            sign (int): 1 to add the rows, -1 to take rows that were added before out again.
+        """
+        for level in levels or list(ROLLUPS):
+            keys = ROLLUPS[level]
+            rows = data.dropna(subset=['task_name']) if level == 'task' else data
+            if not len(rows):
+                continue
+            sums = rows.groupby(keys)[MEASURES].sum() * sign
+            sums['n_rows'] = rows.groupby(keys).size() * sign
+            updates = ', '.join(f'{column} = {column} + excluded.{column}' for column in MEASURES + ['n_rows'])
+            self.connection.executemany(
+                f"INSERT INTO rollup_{level} VALUES ({', '.join('?' * (len(keys) + len(MEASURES) + 1))}) "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}",
+                [(*map(str, key if isinstance(key, tuple) else (key,)), *map(float, values[:-1]), int(values[-1]))
+                 for key, values in zip(sums.index, sums.itertuples(index=False))]
+            )
+            if sign < 0:
+                self.connection.execute(f"DELETE FROM rollup_{level} WHERE n_rows <= 0")
+
+    def update(self, store_dir, manifest):
+        """
+        Loads the parts of the columnar store that are new or changed since the last update. Task files named after
+        a run that is already loaded are skipped without reading them, and rows of loaded runs are left out, so a run
+        found in several files (e.g. a copy of a task file under another name) is only counted once. A run that has
+        both task rows and a total row is counted once in the assignment and day rollups, from its task rows: when the
+        task rows of a run arrive after its total row, the total row is taken out of those rollups again. Every file is
+        loaded in one transaction.
+
+        Parameters:
+            store_dir (str): Directory of the columnar store.
+            manifest (dict): The manifest of the store, as returned by ingest.
+
+        Returns:
+            int: Number of new runs added to the rollups.
+        """
+        import pyarrow.parquet as pq
+
+        loaded_files = dict(self.connection.execute("SELECT part, fingerprint FROM loaded_files"))
+        loaded_runs = self.loaded_runs()
+        parts = {entry['name']: entry['part'] for entry in manifest.values()}
+        n_runs = 0
+        for entry in sorted(manifest.values(), key=lambda entry: os.path.basename(entry['name'])):
+            fingerprint = str(entry['fingerprint'])
+            if loaded_files.get(entry['part']) == fingerprint:
+                continue
+
+            with self.connection:
+                run_file = RUN_FILE_PATTERN.search(entry['name'])
+                if run_file is None or (run_file.group(1), 'task') not in loaded_runs:
+                    data = prepare_rows(pq.read_table(os.path.join(store_dir, entry['part'])).to_pandas())
+                    runs = data[['run_id', 'kind']].drop_duplicates()
+                    new_runs = [run for run in runs.itertuples(index=False, name=None) if run not in loaded_runs]
+                    data = data[pd.MultiIndex.from_frame(data[['run_id', 'kind']]).isin(new_runs)]
+                    task_runs = {run_id for run_id, kind in loaded_runs.union(new_runs) if kind == 'task'}
+                    other_levels = [level for level in ROLLUPS if level not in RUN_ONCE_ROLLUPS]
+                    self.add_rows(data, other_levels)
+                    self.add_rows(data[(data['kind'] == 'task') | ~data['run_id'].isin(task_runs)], RUN_ONCE_ROLLUPS)
+
+                    # Total rows counted before the task rows of their run were loaded
+                    counted_totals = [run_id for run_id, kind in new_runs if kind == 'task' and (run_id, 'total') in loaded_runs]
+                    for run_id, file in self.connection.execute(
+                        f"SELECT run_id, file FROM loaded_runs WHERE kind = 'total' AND run_id IN ({', '.join('?' * len(counted_totals))})", counted_totals
+                    ).fetchall():
+                        totals = prepare_rows(pq.read_table(os.path.join(store_dir, parts[file])).to_pandas())
+                        self.add_rows(totals[(totals['run_id'] == run_id) & (totals['kind'] == 'total')], RUN_ONCE_ROLLUPS, sign=-1)
+                    self.connection.executemany("INSERT INTO loaded_runs VALUES (?, ?, ?)", [(*run, entry['name']) for run in new_runs])
+                    loaded_runs.update(new_runs)
+                    n_runs += len(new_runs)
+                self.connection.execute("INSERT OR REPLACE INTO loaded_files VALUES (?, ?)", (entry['part'], fingerprint))
+        return n_runs
+
+    def check_totals(self):
+        """
+        Checks that the assignment and day rollups hold every run exactly once, by comparing their total emissions
+        with the sum over the runs: the task rows of runs with tasks and the total rows of runs without. Raises a
+        ValueError if a rollup does not add up.
+        """
+        expected = self.connection.execute(
+            "SELECT COALESCE(SUM(emissions), 0) FROM rollup_run WHERE kind = 'task' "
+            "OR run_id NOT IN (SELECT run_id FROM rollup_run WHERE kind = 'task')"
+        ).fetchone()[0]
+        for level in RUN_ONCE_ROLLUPS:
+            total = self.connection.execute(f"SELECT COALESCE(SUM(emissions), 0) FROM rollup_{level}").fetchone()[0]
+            if not math.isclose(total, expected, rel_tol=1e-9, abs_tol=1e-15):
+                raise ValueError(f"The {level} rollup sums to {total} kg CO2eq, but the runs sum to {expected} kg CO2eq")
+
+    def rollup(self, level):
+        """
+        Reads a rollup table.
+
+        Parameters:
+            level (str): Level of the rollup: 'assignment', 'task', 'run', or 'day'.
+
+        Returns:
+            pd.DataFrame: The summed emissions, energy use, and duration per key, sorted by key.
+        """
+        keys = ', '.join(ROLLUPS[level])
+        return pd.read_sql_query(f"SELECT * FROM rollup_{level} ORDER BY {keys}", self.connection)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,113 @@
+######
+# Import-time profiling of the assignment scripts
+######
+
+# Importing packages
+import argparse
+import csv
+import glob
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Defining argument parsing
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Summarise the startup import time of the assignment scripts with python -X importtime.')
+    parser.add_argument('--scripts', type=str, nargs='+', default=None, help='Scripts to profile, defaults to the scripts each Assignment_*/run.sh can run')
+    parser.add_argument('--python', type=str, default=sys.executable, help='Python interpreter used to run the scripts')
+    parser.add_argument('--top', type=int, default=5, help='Number of slowest top-level packages to show per script')
+    parser.add_argument('--output', type=str, default=None, help='Optional CSV file to save the per-package breakdown to')
+    return parser.parse_args()
+
+#####
+# Defining Functions
+#####
+
+def find_scripts():
+    """
+    Finds the entry points of all assignments: the scripts named in each assignment's run.sh. Helper modules
+    in src that are only imported by these scripts are left out.
+
+    Returns:
+        list of str: Paths to the scripts.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    scripts = []
+    for run_script in sorted(glob.glob(os.path.join(root, 'Assignment_*', 'run.sh'))):
+        with open(run_script) as f:
+            names = dict.fromkeys(re.findall(r'[\w-]+\.py', f.read()))
+        src_dir = os.path.join(os.path.dirname(run_script), 'src')
+        scripts.extend(os.path.join(src_dir, name) for name in names if os.path.exists(os.path.join(src_dir, name)))
+    return scripts
+
+def parse_importtime(stderr):
+    """
+    Sums the cumulative import time of every top-level package from python -X importtime output.
+
+    Parameters:
+        stderr (str): The stderr output of a python -X importtime run.
+
+    Returns:
+        dict: Cumulative import time in milliseconds for each top-level package.
+    """
+    package_times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented, so only unindented names are top-level imports
+        if name.startswith('  '):
+            continue
+        package = name.strip().split('.')[0]
+        package_times[package] = package_times.get(package, 0) + int(cumulative) / 1000
+    return package_times
+
+def profile_script(script, python):
+    """
+    Runs a script with --help under python -X importtime and measures its startup.
+
+    Parameters:
+        script (str): Path to the script.
+        python (str): Python interpreter to use.
+
+    Returns:
+        tuple: Wall-clock startup time in milliseconds, import time per top-level package, and the error output if the run failed.
+    """
+    start_time = time.perf_counter()
+    result = subprocess.run([python, '-X', 'importtime', os.path.basename(script), '--help'],
+                            cwd=os.path.dirname(script), capture_output=True, text=True)
+    wall_time = (time.perf_counter() - start_time) * 1000
+    errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+    return wall_time, parse_importtime(result.stderr), errors[-1] if result.returncode != 0 and errors else None
+
+#####
+# Main Function
+#####
+
+def main():
+    args = parse_arguments()
+    scripts = args.scripts or find_scripts()
+
+    rows = []
+    for script in scripts:
+        wall_time, package_times, error = profile_script(os.path.abspath(script), args.python)
+        name = os.path.relpath(os.path.abspath(script), os.path.dirname(os.path.abspath(__file__)))
+        print(f"{name}: {wall_time:.0f} ms startup, {sum(package_times.values()):.0f} ms importing")
+        if error:
+            print(f"    WARNING: startup failed ({error})")
+        for package, ms in sorted(package_times.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"    {package:<24}{ms:>10.1f} ms")
+        for package, ms in package_times.items():
+            rows.append({'script': name, 'package': package, 'import_ms': round(ms, 3), 'startup_ms': round(wall_time, 3)})
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['script', 'package', 'import_ms', 'startup_ms'])
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Import-time breakdown saved to {args.output}")
+
+if __name__ == "__main__":
+    main()